@@ -2,7 +2,38 @@ import asyncio
 import os
 
 import gradio as gr
+from pool import ServerPool
 from run import LiteResearchMCPClient
+from scheduler import QueryScheduler, QueueFullError
+
+mcp_servers = ['crawl4ai', 'notebook', 'web-search']
+
+# The MCP servers are shared by all the users of the app
+server_pool: ServerPool = None
+server_pool_lock = asyncio.Lock()
+
+
+async def get_server_pool() -> ServerPool:
+    global server_pool
+    # Concurrent connects and searches wait for the same pool to start
+    async with server_pool_lock:
+        if server_pool is None:
+            pool = ServerPool(LiteResearchMCPClient.generate_config(mcp_servers),
+                              exclusive=LiteResearchMCPClient.stateful_servers,
+                              max_processes=int(os.environ.get('MCP_MAX_PROCESSES', 8)))
+            try:
+                await pool.start(mcp_servers)
+            except BaseException:
+                await pool.close()
+                raise
+            server_pool = pool
+    return server_pool
+
+
+scheduler = QueryScheduler(max_concurrent=int(os.environ.get('MAX_CONCURRENT_QUERIES', 4)),
+                           max_queue=int(os.environ.get('MAX_QUEUED_QUERIES', 32)),
+                           max_rounds=int(os.environ.get('MAX_QUERY_ROUNDS', 60)),
+                           max_seconds=float(os.environ.get('MAX_QUERY_SECONDS', 1800)))
 
 
 def start():
@@ -25,14 +56,12 @@ def start():
                 state = gr.State([])
 
                 async def connect_server(base_url, model, token, state):
-                    if state:
-                        asyncio.run(state[0].cleanup())
                     if not token:
                         token = os.environ.get('MODEL_TOKEN', '')
                     assert token, 'Please input a token or use `MODEL_TOKEN` env.'
                     client = LiteResearchMCPClient(base_url=base_url, model=model,
-                                                   token=token, mcp=['crawl4ai', 'notebook', 'web-search'])
-                    await client.connect_all_servers(None)
+                                                   token=token, mcp=mcp_servers)
+                    await get_server_pool()
                     gr.Info('🚂Server started🏁')
                     return [client], gr.update(value=True, label='🍏Connected')
 
@@ -58,28 +87,47 @@ def start():
                     ex5 = gr.Button(value="Write a paper of 1000 words to introduce Elon Mask.", scale=6)
                     ex5.click(lambda x: x, [ex5], [query])
 
-        async def search(default_system, user_input, top_p, temperature, max_completion_length, state):
+        async def search(default_system, user_input, top_p, temperature, max_completion_length, state,
+                         request: gr.Request):
             if not state:
                 raise gr.Error(f'Connect server first')
-            yield [], ''
-            history = [[user_input, '']]
-            async for response in state[0].process_query(
-                    default_system,
-                    user_input,
-                    system='o1' not in state[0].model,
-                    top_p=top_p,
-                    temperature=temperature,
-                    max_completion_length=max_completion_length):
-                query = ''
-                if 'tool result:' in response:
-                    response, query = response.split('tool result:')
-                history[-1][-1] = response
-                yield history, ''
-                query = query.replace('<', '').replace('>', '')
-                history.append([query, ''])
+            try:
+                ticket = scheduler.submit(request.session_hash)
+            except QueueFullError as e:
+                raise gr.Error(str(e))
+            try:
+                yield [], ''
+                history = [[user_input, '']]
+                async for position in scheduler.wait(ticket):
+                    history[-1][-1] = f'⏳ Waiting in queue, position {position}'
+                    yield history, ''
+                history[-1][-1] = ''
+                client = state[0]
+                pool = await get_server_pool()
+                async with pool.lease(client.mcp) as sessions:
+                    client.sessions = sessions
+                    async for response in client.process_query(
+                            default_system,
+                            user_input,
+                            system='o1' not in client.model,
+                            max_rounds=scheduler.max_rounds,
+                            max_seconds=scheduler.max_seconds,
+                            top_p=top_p,
+                            temperature=temperature,
+                            max_completion_length=max_completion_length):
+                        query = ''
+                        if 'tool result:' in response:
+                            response, query = response.split('tool result:')
+                        history[-1][-1] = response
+                        yield history, ''
+                        query = query.replace('<', '').replace('>', '')
+                        history.append([query, ''])
+            finally:
+                scheduler.release(ticket)
 
+        # Concurrency is limited by the scheduler
         submit2.click(search, [default_system, query, top_p, temperature,
-                               max_completion_length, state], [chat, query])
+                               max_completion_length, state], [chat, query], concurrency_limit=None)
 
     demo.launch(server_name='0.0.0.0', inbrowser=True)
 
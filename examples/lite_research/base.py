@@ -1,17 +1,39 @@
+import asyncio
+import functools
+import importlib.util
 import inspect
 import json
 import os
 import re
 import shutil
+import sys
 import time
-from contextlib import AsyncExitStack
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
 from typing import Dict, List, Any
 
+from fastmcp.client.transports import FastMCPTransport
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from openai import OpenAI
 from openai.types.chat import ChatCompletion
 
+from cache import ToolCache
+from context import ContextManager
+from dedup import ParagraphDeduplicator
+from rank import select_passages
+from replay import Recorder, RecordingSession
+from servers import LazySession, ToolManifest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from mcp_central.tracing import TRACE_FILE_ENV, Span, Tracer, call_tool, payload_size  # noqa: E402
+
+tracer = Tracer('lite_research')
+
+
+class QueryTimeoutError(Exception):
+    """The query reached the `max_seconds` budget of `process_query`."""
+
 
 class MCPClient:
     default_system = ('You are an assistant which helps me to finish a complex job. Tools may be given to you '
@@ -19,7 +41,88 @@ class MCPClient:
 
     connector = '\n\nHere gives the user query:\n\n'
 
-    def __init__(self, base_url, token, model, mcp):
+    summary_prompt = """Based on the query: "{query}", filter this content to keep only the most relevant information.
+
+Your task is to:
+1. Mandatory: Retain ALL information directly relevant to the query
+2. Mandatory: Keep URLs and links that provide useful resources related to the query
+3. Mandatory: Filter out URLs and content that are not helpful for addressing the query
+4. Mandatory: Preserve technical details, specifications, and instructions related to the query
+5. Mandatory: Maintain the connection between relevant information and its corresponding URLs
+
+Format your response as a JSON object without code block markers, containing:
+- "title": A descriptive title reflecting the query focus (5-12 words)
+- "summary": Filtered content with only query-relevant information and URLs
+- "status": "success" if the content is relevant to the query, "error" if the content is irrelevant or contains incorrect information
+
+Content to process:
+{content}
+
+Filtering guidelines:
+- Keep URLs that provide resources, tools, downloads, or information directly related to the query
+- Remove URLs to general pages, social media, promotional content, or unrelated material
+- Keep all technical specifications, code samples, or detailed instructions that address the query
+- Preserve product names, model numbers, and version information relevant to the query
+- Remove generic content, filler text, or background information that doesn't help answer the query
+- When evaluating a URL, consider where it leads and whether that destination would help someone with this query
+
+Error detection guidelines:
+- Set "status" to "error" if the content appears to be in a different language than expected
+- Set "status" to "error" if the content is about a completely different topic than the query (e.g., query about technology but content about tourism)
+- Set "status" to "error" if the content contains obvious factual errors or contradictions
+- Set "status" to "error" if URLs lead to unrelated content like tourism sites when querying for technical information
+- Set "status" to "error" if the content appears to be machine-translated or unintelligible
+- When setting "status" to "error", include a brief explanation in the summary field
+
+The goal is intelligent filtering with error detection - keeping all information and links that would be valuable for someone with this specific query, while removing everything else and flagging irrelevant or incorrect content.
+DO NOT add any other parts like ```json which may cause parse error of json."""
+
+    reduce_prompt = """Based on the query: "{query}", merge these partial results into one result.
+
+Each partial result is a JSON object with "title", "summary" and "status", produced from one part of a long content \
+filtered against the query.
+
+Your task is to:
+1. Mandatory: Retain ALL information directly relevant to the query from every partial result
+2. Mandatory: Keep every useful URL and link together with the information it belongs to
+3. Mandatory: Remove duplicated information between the partial results
+
+Format your response as a JSON object without code block markers, containing:
+- "title": A descriptive title reflecting the query focus (5-12 words)
+- "summary": The merged content with only query-relevant information and URLs
+- "status": "success" if the content is relevant to the query, "error" if the content is irrelevant or contains incorrect information
+
+Partial results to merge:
+{content}
+
+DO NOT add any other parts like ```json which may cause parse error of json."""
+
+    # Max characters of content sent in one summary call
+    summary_chunk_size = 64000
+
+    # Max summary calls running at the same time
+    summary_concurrency = 4
+
+    # Max reduce passes before falling back to truncation
+    summary_max_depth = 3
+
+    # Max characters of the web-search result passages sent to `summary`
+    search_budget = 12000
+
+    # Token budget of the message history in `process_query`
+    context_budget = 64000
+
+    # Servers keeping state between the tool calls of a query, they are never shared or stopped when idle
+    stateful_servers = ['notebook']
+
+    # The tool results cache, shared by all the clients of the process which are not given their own
+    tool_cache = ToolCache()
+
+    # The cached tool schemas of the lazily started servers
+    manifest_file = os.path.expanduser('~/.cache/mcp_central/tool_manifest.json')
+
+    def __init__(self, base_url, token, model, mcp, recorder: Recorder = None, lazy: bool = False,
+                 idle_timeout: float = 300.0, inprocess: bool = False, tool_cache: ToolCache = None):
         self.sessions: Dict[str, ClientSession] = {}
         self.exit_stack = AsyncExitStack()
         self.current_server = None
@@ -27,13 +130,28 @@ class MCPClient:
         self.model = model
         self.base_url = base_url
         self.mcp = mcp
+        self.recorder = recorder
+        self.lazy = lazy
+        self.idle_timeout = idle_timeout
+        self.inprocess = inprocess
+        if tool_cache is None and recorder is not None:
+            # Record and replay every call, a shared cache would skip them for all but one query
+            tool_cache = ToolCache(policies={})
+        if tool_cache is not None:
+            self.tool_cache = tool_cache
         self.client = OpenAI(
             api_key=self.token,
             base_url=self.base_url,
         )
+        self.summary_semaphore = asyncio.Semaphore(self.summary_concurrency)
+        self.context = None
+        self.cache_stats = {}
+        self.deduplicator = ParagraphDeduplicator()
+        self.trace_root = None
+        # The time at which the running query stops, see `max_seconds` of `process_query`
+        self.deadline = None
 
     def generate_response(self, messages, model, tools=None, **kwargs) -> ChatCompletion:
-        time.sleep(0.5)
         if tools:
             tools = [
                 {
@@ -46,24 +164,46 @@ class MCPClient:
                 } for tool in tools
             ]
 
-        _e = None
-        completion = None
         parameters = inspect.signature(self.client.chat.completions.create).parameters
         kwargs = {key: value for key, value in kwargs.items() if key in parameters}
+        with tracer.span('generate_response', default_parent=self.trace_root, model=model,
+                         request_bytes=sum(payload_size(message.get('content')) for message in messages)) as span:
+            if self.recorder is not None and self.recorder.completions:
+                request = dict(model=model, messages=messages, tools=tools, parallel_tool_calls=False, **kwargs)
+                completion = self.recorder.completion(
+                    request, lambda: self._create_completion(messages, model, tools, **kwargs))
+            else:
+                completion = self._create_completion(messages, model, tools, **kwargs)
+            span.set(response_bytes=payload_size(completion.choices[0].message.content))
+            if completion.usage is not None:
+                span.set(prompt_tokens=completion.usage.prompt_tokens,
+                         completion_tokens=completion.usage.completion_tokens)
+            return completion
+
+    def _create_completion(self, messages, model, tools=None, **kwargs) -> ChatCompletion:
+        if self.recorder is None or not self.recorder.replaying:
+            # Paces the requests to the model api, a replay server answers with the recorded latencies instead
+            time.sleep(0.5)
+        _e = None
+        completion = None
         for i in range(20):
             try:
-                completion = self.client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    tools=tools,
-                    parallel_tool_calls=False,
-                    **kwargs
-                )
+                with tracer.span('llm_attempt', attempt=i):
+                    completion = self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        tools=tools,
+                        parallel_tool_calls=False,
+                        **kwargs
+                    )
                 _e = None
                 break
             except Exception as e:
                 print(str(e))
                 _e = e
+                if self.deadline is not None and time.time() + 20 > self.deadline:
+                    # The query stops before the next attempt
+                    break
                 time.sleep(20)
                 continue
         if _e:
@@ -71,7 +211,13 @@ class MCPClient:
         return completion
 
     @staticmethod
-    def generate_config(mcp_servers: List[str]) -> Dict[str, Any]:
+    def generate_config(mcp_servers: List[str], inprocess: bool = False) -> Dict[str, Any]:
+        """Generate the server configs.
+
+        Args:
+            mcp_servers: The server names, all the servers of mcp_central and config.json if empty.
+            inprocess: Run the FastMCP servers of mcp_central in the client process instead of stdio subprocesses.
+        """
         mcp_path = os.path.abspath('../../')
         if not mcp_servers:
             for base_dir, dirs, files in os.walk('../../mcp_central'):
@@ -103,6 +249,8 @@ class MCPClient:
                 for idx in range(len(args)):
                     if 'server.py' in args[idx]:
                         args[idx] = os.path.join(mcp_abs_path, 'server.py')
+                if inprocess:
+                    mcp_content['transport'] = 'inprocess'
             config_json[mcp_server] = mcp_content
 
         if os.path.exists('./config.json'):
@@ -113,23 +261,22 @@ class MCPClient:
 
         return config_json
 
-    async def connect_to_server(self, command, args, env=None, server_name: str = None):
-        server_params = StdioServerParameters(
-            command=command,
-            args=args,
-            env=env,
-        )
+    async def connect_to_server(self, command, args, env=None, server_name: str = None, transport: str = 'stdio'):
+        with tracer.span('connect_to_server', server=server_name, transport=transport):
+            return await self._connect_to_server(command, args, env, server_name, transport)
 
-        stdio_transport = await self.exit_stack.enter_async_context(
-            stdio_client(server_params)
-        )
+    async def _connect_to_server(self, command, args, env=None, server_name: str = None, transport: str = 'stdio'):
+        if self.recorder is not None and self.recorder.replaying:
+            self.sessions[server_name] = RecordingSession(self.recorder, server_name)
+            if self.current_server is None:
+                self.current_server = server_name
+            return server_name
 
-        stdio, write = stdio_transport
         session = await self.exit_stack.enter_async_context(
-            ClientSession(stdio, write)
+            self.open_session({'command': command, 'args': args, 'env': env, 'transport': transport})
         )
-
-        await session.initialize()
+        if self.recorder is not None:
+            session = RecordingSession(self.recorder, server_name, session)
 
         # Store session
         self.sessions[server_name] = session
@@ -145,6 +292,70 @@ class MCPClient:
 
         return server_name
 
+    @staticmethod
+    def resolve_env(env_dict: Dict[str, str]) -> Dict[str, str]:
+        """Fill the empty values of a server env from the environment variables."""
+        return {key: value if value else os.environ.get(key, '') for key, value in (env_dict or {}).items()}
+
+    @staticmethod
+    def stdio_parameters(command, args, env=None) -> StdioServerParameters:
+        if tracer.path:
+            env = {**(env or {}), TRACE_FILE_ENV: tracer.path}
+        return StdioServerParameters(
+            command=command,
+            args=args,
+            env=env,
+        )
+
+    @staticmethod
+    @asynccontextmanager
+    async def open_session(config: Dict[str, Any]):
+        """Start a server from its config and yield its initialized session."""
+        if config.get('transport') == 'inprocess':
+            async with MCPClient.open_inprocess_session(config) as session:
+                yield session
+            return
+        params = MCPClient.stdio_parameters(config['command'], config['args'],
+                                            MCPClient.resolve_env(config.get('env', {})))
+        async with stdio_client(params) as (stdio, write):
+            async with ClientSession(stdio, write) as session:
+                with tracer.span('server_start', command=config['command']):
+                    await session.initialize()
+                yield session
+
+    @staticmethod
+    @asynccontextmanager
+    async def open_inprocess_session(config: Dict[str, Any]):
+        """Load a FastMCP server.py and connect to it through memory streams in the current event loop.
+
+        Each session loads its own copy of the module, so the module level state (e.g. the notebook) is not shared.
+        The `env` of the config is set while the module is loaded, for the settings the servers read at load time
+        (e.g. `CRAWL4AI_PROFILE`), then the previous environment is restored.
+        """
+        path = next(arg for arg in config['args'] if arg.endswith('server.py'))
+        module_name = f'mcp_central_inprocess_{uuid.uuid4().hex}'
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            env = MCPClient.resolve_env(config.get('env', {}))
+            saved = {key: os.environ.get(key) for key in env}
+            # No await while the environment is changed, the other tasks never see it
+            os.environ.update(env)
+            try:
+                with tracer.span('server_start', command=path, transport='inprocess'):
+                    spec.loader.exec_module(module)
+            finally:
+                for key, value in saved.items():
+                    if value is None:
+                        os.environ.pop(key, None)
+                    else:
+                        os.environ[key] = value
+            async with FastMCPTransport(module.mcp).connect_session() as session:
+                yield session
+        finally:
+            sys.modules.pop(module_name, None)
+
     async def switch_server(self, server_name: str):
         """Switch to a different connected server"""
         if server_name not in self.sessions:
@@ -169,212 +380,336 @@ class MCPClient:
             marker = "* " if name == self.current_server else "  "
             print(f"{marker}{name}")
 
-    def summary(self, query, content, **kwargs):
-        prompt = """Based on the query: "{query}", filter this content to keep only the most relevant information.
-
-Your task is to:
-1. Mandatory: Retain ALL information directly relevant to the query
-2. Mandatory: Keep URLs and links that provide useful resources related to the query
-3. Mandatory: Filter out URLs and content that are not helpful for addressing the query
-4. Mandatory: Preserve technical details, specifications, and instructions related to the query
-5. Mandatory: Maintain the connection between relevant information and its corresponding URLs
-
-Format your response as a JSON object without code block markers, containing:
-- "title": A descriptive title reflecting the query focus (5-12 words)
-- "summary": Filtered content with only query-relevant information and URLs
-- "status": "success" if the content is relevant to the query, "error" if the content is irrelevant or contains incorrect information
-
-Content to process:
-{content}
-
-Filtering guidelines:
-- Keep URLs that provide resources, tools, downloads, or information directly related to the query
-- Remove URLs to general pages, social media, promotional content, or unrelated material
-- Keep all technical specifications, code samples, or detailed instructions that address the query
-- Preserve product names, model numbers, and version information relevant to the query
-- Remove generic content, filler text, or background information that doesn't help answer the query
-- When evaluating a URL, consider where it leads and whether that destination would help someone with this query
-
-Error detection guidelines:
-- Set "status" to "error" if the content appears to be in a different language than expected
-- Set "status" to "error" if the content is about a completely different topic than the query (e.g., query about technology but content about tourism)
-- Set "status" to "error" if the content contains obvious factual errors or contradictions
-- Set "status" to "error" if URLs lead to unrelated content like tourism sites when querying for technical information
-- Set "status" to "error" if the content appears to be machine-translated or unintelligible
-- When setting "status" to "error", include a brief explanation in the summary field
-
-The goal is intelligent filtering with error detection - keeping all information and links that would be valuable for someone with this specific query, while removing everything else and flagging irrelevant or incorrect content.
-DO NOT add any other parts like ```json which may cause parse error of json."""
-
+    async def call_tool(self, server_name, tool_name, args):
+        with tracer.span('call_tool', default_parent=self.trace_root, server=server_name, tool=tool_name,
+                         request_bytes=payload_size(args)) as span:
+            result = await self.tool_cache.call(f'{server_name}---{tool_name}', args,
+                                                lambda: call_tool(self.sessions[server_name], tool_name, args),
+                                                self.cache_stats)
+            span.set(response_bytes=sum(payload_size(getattr(content, 'text', None)) for content in result.content),
+                     is_error=result.isError)
+            return result
+
+    async def summary(self, query, content, **kwargs):
+        with tracer.span('summary', default_parent=self.trace_root, request_bytes=payload_size(content)) as span:
+            result = await self.tool_cache.call('summary', [query, content, self.model],
+                                                lambda: self._map_reduce_summary(query, content, **kwargs),
+                                                self.cache_stats)
+            span.set(response_bytes=payload_size(result))
+            return result
+
+    async def _map_reduce_summary(self, query, content, **kwargs):
+        chunks = self.split_content(content, self.summary_chunk_size)
+        tracer.current().set(chunks=len(chunks))
+        partials = await asyncio.gather(*[
+            self._summary_call(self.summary_prompt, query, chunk, **kwargs) for chunk in chunks
+        ])
+        depth = 0
+        while len(partials) > 1:
+            partials = [self._load_summary(partial) for partial in partials]
+            relevant = [partial for partial in partials if partial.get('status') != 'error']
+            if not relevant:
+                return json.dumps(partials[0], ensure_ascii=False)
+            merged = [json.dumps(partial, ensure_ascii=False) for partial in relevant]
+            if len(merged) == 1:
+                return merged[0]
+            if depth >= self.summary_max_depth:
+                # The partial summaries do not shrink any more, merge them without the model and keep what fits.
+                return json.dumps(self.merge_summaries(relevant, self.summary_chunk_size), ensure_ascii=False)
+            groups = self.split_content('\n\n'.join(merged), self.summary_chunk_size)
+            partials = await asyncio.gather(*[
+                self._summary_call(self.reduce_prompt, query, group, **kwargs) for group in groups
+            ])
+            depth += 1
+        return partials[0]
+
+    async def _summary_call(self, prompt, query, content, **kwargs):
         query = prompt.replace("{query}", query).replace("{content}", content)
         messages = [{'role': 'user', 'content': query}]
-        if len(query) < 80000:
-            response = self.generate_response(messages, self.model, **kwargs)
-            content = response.choices[0].message.content
-        else:
-            content = 'Content too long, you need to try another website or search another keyword'
-        return content
+        async with self.summary_semaphore:
+            response = await asyncio.to_thread(self.generate_response, messages, self.model, **kwargs)
+        return response.choices[0].message.content
+
+    @staticmethod
+    def _load_summary(content):
+        try:
+            content = json.loads(content)
+            if isinstance(content, dict):
+                return content
+        except Exception:
+            pass
+        return {'title': '', 'summary': str(content), 'status': 'success'}
 
-    async def process_query(self, default_system, query: str, system=True, **kwargs) -> str:
+    @staticmethod
+    def merge_summaries(partials, max_length):
+        """Merge the partial summaries into one, its `summary` cut to `max_length` characters."""
+        summary = '\n\n'.join(str(partial.get('summary', '')) for partial in partials)
+        return {
+            'title': partials[0].get('title', ''),
+            'summary': summary[:max_length],
+            'status': 'success',
+        }
+
+    @staticmethod
+    def split_content(content, chunk_size):
+        """Split content into chunks no longer than chunk_size, preferring paragraph boundaries."""
+        chunks = []
+        current = ''
+        for paragraph in content.split('\n\n'):
+            while len(paragraph) > chunk_size:
+                if current:
+                    chunks.append(current)
+                    current = ''
+                chunks.append(paragraph[:chunk_size])
+                paragraph = paragraph[chunk_size:]
+            if current and len(current) + len(paragraph) + 2 > chunk_size:
+                chunks.append(current)
+                current = ''
+            current = current + '\n\n' + paragraph if current else paragraph
+        if current or not chunks:
+            chunks.append(current)
+        return chunks
+
+    async def process_query(self, default_system, query: str, system=True, max_rounds: int = None,
+                            max_seconds: float = None, **kwargs) -> str:
+        self.deadline = time.time() + max_seconds if max_seconds is not None else None
         if not default_system:
             default_system = self.default_system
         if system:
             messages = [{'role': 'system', 'content': default_system}, {"role": "user", "content": query}]
         else:
             messages = [{"role": "user", "content": default_system + self.connector + query}]
-        tools = []
-        for key, session in self.sessions.items():
-            if key == 'edgeone-pages-mcp-server':
-                continue
-            response = await session.list_tools()
-            available_tools = [
-                {
-                    "name": key + '---' + tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema
-                }
-                for tool in response.tools if tool.name not in ('tavily-extract')
-            ]
-            tools.extend(available_tools)
-
-        task_done_cnt = 0
-        final_result = ''
-        result_section = False
-        while True:
-            response = self.generate_response(messages, self.model, tools=tools, **kwargs)
-            message = response.choices[0].message
+        context = ContextManager(messages, budget=self.context_budget)
+        self.context = context
+        self.trace_root = Span('process_query', tracer.service, query_bytes=payload_size(query))
+        try:
+            self.cache_stats = {}
+            self.deduplicator = ParagraphDeduplicator()
+            messages = context.messages
+            tools = []
+            for key, session in self.sessions.items():
+                if key == 'edgeone-pages-mcp-server':
+                    continue
+                response = await session.list_tools()
+                available_tools = [
+                    {
+                        "name": key + '---' + tool.name,
+                        "description": tool.description,
+                        "input_schema": tool.inputSchema
+                    }
+                    for tool in response.tools if tool.name not in ('tavily-extract')
+                ]
+                tools.extend(available_tools)
+
+            task_done_cnt = 0
+            final_result = ''
+            result_section = False
             try:
-                reasoning = message.model_extra['reasoning_content']
-            except:
-                reasoning = ''
-            content = reasoning + (message.content or '')
-            if '<task_done>' in content or task_done_cnt >= 4:
-                break
-            if '<result>' in content and '</result>' in content:
-                pattern = r"<result>(.*?)</result>"
-                final_result = re.findall(pattern, content, re.DOTALL)
-            elif '<result>' in content:
-                result_section = True
-                final_result += content.split('<result>')[1]
-            elif '</result>' in content:
-                final_result += content.split('</result>')[0]
-                result_section = False
-            elif result_section:
-                final_result += content
-            if content.strip() or message.tool_calls:
-                messages.append({
-                    "role": "assistant",
-                    "content": content.strip(),
-                    'tool_calls': message.tool_calls if not message.tool_calls else [message.tool_calls[0]],
-                })
-            if message.tool_calls:
-                for tool in message.tool_calls:
+                while True:
+                    if max_rounds is not None and len(context.metrics) >= max_rounds:
+                        yield f'Stopped: the query reached the limit of {max_rounds} rounds.'
+                        break
+                    if self.deadline is not None and time.time() > self.deadline:
+                        raise QueryTimeoutError()
+                    compressed = context.enforce_budget()
+                    response = await self.before_deadline(
+                        asyncio.to_thread(self.generate_response, messages, self.model, tools=tools, **kwargs))
+                    print(f'context: {context.record_turn(response.usage, compressed)}')
+                    message = response.choices[0].message
                     try:
-                        name = tool.function.name
-                        args = tool.function.arguments
-                        if name == 'advance_to_next_step':
-                            name = 'notebook---advance_to_next_step'
-                        key, tool_name = name.split('---')
-                        args = json.loads(args)
-                        if tool.function.name == 'notebook---initialize_task':
-                            user_query = args.get('user_query', '')
-                            user_query = user_query.split(self.connector)
-                            if len(user_query) > 1:
-                                user_query = user_query[1]
-                                args['user_query'] = user_query
-                        elif tool.function.name == 'notebook---verify_task_completion':
-                            task_done_cnt += 1
-                        if 'advance_to_next_step' in tool.function.name:
-                            start = 1
-                            _messages = [messages[0]]
-                            if messages[0]['role'] == 'system':
-                                start = 2
-                                _messages.append(messages[1])
-                            for i in range(start, len(messages)-1, 2):
-                                resp = messages[i]
-                                qry = messages[i+1]
-                                if resp.get('tool_calls') and 'advance_to_next_step' in resp['tool_calls'][0].function.name:
-                                    continue
-                                _messages.append(resp)
-                                _messages.append(qry)
-                            if _messages[-1] is not messages[-1]:
-                                _messages.append(messages[-1])
-                            messages = _messages
-
-                        # if tool.function.name == 'notebook---store_intermediate_results':
-                        #     args['data'] = messages[-2]['content']
-                        #     tool.function.arguments = 'Arguments removed to brief context.'
-                        if tool.function.name == 'web-search---tavily-search':
-                            args['include_domains'] = []
-                            args['include_raw_content'] = False
-                        result = await self.sessions[key].call_tool(tool_name, args)
-                        # if len(result.content[0].text) > 20000:
-                        #     result.content[0].text += ('\n\nContent too long, '
-                        #                                'Call notebook---store_intermediate_results to summarize.')
-                        tool_result = (result.content[0].text or '').strip()
-                        if key in ('web-search'):
-                            _args: dict = self.summary(query, tool_result, **kwargs)
-                            _print_origin_result = tool_result
-                            if len(_print_origin_result) > 512:
-                                _print_origin_result = _print_origin_result[:512] + '...'
-                            print(tool_name, args, _print_origin_result)
-                            tool_result = str(_args)
-                        # if tool.function.name == 'notebook---store_intermediate_results':
-                        #     messages[-2]['content'] = f'Tool result cached to notebook with title: {args["title"]}'
-                        if 'advance_to_next_step' in tool.function.name:
-                            content_and_system = json.loads(tool_result)
-                            tool_result = content_and_system[0]
-                            system = content_and_system[1]
-                            if 'Previous main task done' in tool_result:
-                                _messages = [messages[0]]
-                                if messages[0]['role'] == 'system':
-                                    _messages.append(messages[1])
-                                messages = _messages
-                            if 'Previous main task done' in tool_result:
-                                messages.append({
-                                    'role': 'user',
-                                    'content': tool_result,
-                                })
-                            else:
-                                messages.append({
+                        reasoning = message.model_extra['reasoning_content']
+                    except:
+                        reasoning = ''
+                    content = reasoning + (message.content or '')
+                    if '<task_done>' in content or task_done_cnt >= 4:
+                        break
+                    if '<result>' in content and '</result>' in content:
+                        pattern = r"<result>(.*?)</result>"
+                        final_result = re.findall(pattern, content, re.DOTALL)
+                    elif '<result>' in content:
+                        result_section = True
+                        final_result += content.split('<result>')[1]
+                    elif '</result>' in content:
+                        final_result += content.split('</result>')[0]
+                        result_section = False
+                    elif result_section:
+                        final_result += content
+                    if content.strip() or message.tool_calls:
+                        context.append({
+                            "role": "assistant",
+                            "content": content.strip(),
+                            'tool_calls': message.tool_calls if not message.tool_calls else [message.tool_calls[0]],
+                        })
+                    if message.tool_calls:
+                        for tool in message.tool_calls:
+                            try:
+                                name = tool.function.name
+                                args = tool.function.arguments
+                                if name == 'advance_to_next_step':
+                                    name = 'notebook---advance_to_next_step'
+                                key, tool_name = name.split('---')
+                                args = json.loads(args)
+                                if tool.function.name == 'notebook---initialize_task':
+                                    user_query = args.get('user_query', '')
+                                    user_query = user_query.split(self.connector)
+                                    if len(user_query) > 1:
+                                        user_query = user_query[1]
+                                        args['user_query'] = user_query
+                                elif tool.function.name == 'notebook---verify_task_completion':
+                                    task_done_cnt += 1
+                                if 'advance_to_next_step' in tool.function.name:
+                                    start = 1
+                                    _messages = [messages[0]]
+                                    if messages[0]['role'] == 'system':
+                                        start = 2
+                                        _messages.append(messages[1])
+                                    for i in range(start, len(messages)-1, 2):
+                                        resp = messages[i]
+                                        qry = messages[i+1]
+                                        if resp.get('tool_calls') and 'advance_to_next_step' in resp['tool_calls'][0].function.name:
+                                            continue
+                                        _messages.append(resp)
+                                        _messages.append(qry)
+                                    if _messages[-1] is not messages[-1]:
+                                        _messages.append(messages[-1])
+                                    context.replace(_messages)
+                                    messages = context.messages
+
+                                # if tool.function.name == 'notebook---store_intermediate_results':
+                                #     args['data'] = messages[-2]['content']
+                                #     tool.function.arguments = 'Arguments removed to brief context.'
+                                if tool.function.name == 'web-search---tavily-search':
+                                    args['include_domains'] = []
+                                    args['include_raw_content'] = False
+                                result = await self.before_deadline(self.call_tool(key, tool_name, args))
+                                # if len(result.content[0].text) > 20000:
+                                #     result.content[0].text += ('\n\nContent too long, '
+                                #                                'Call notebook---store_intermediate_results to summarize.')
+                                tool_result = (result.content[0].text or '').strip()
+                                if tool.function.name == 'crawl4ai---crawl_website':
+                                    tool_result = self.deduplicate_crawl(tool_result, args.get('website', ''), tool.id)
+                                if key in ('web-search'):
+                                    passages = select_passages(f'{args.get("query", "")} {query}', tool_result,
+                                                               self.search_budget)
+                                    _args: dict = await self.before_deadline(self.summary(query, passages, **kwargs))
+                                    _print_origin_result = tool_result
+                                    if len(_print_origin_result) > 512:
+                                        _print_origin_result = _print_origin_result[:512] + '...'
+                                    print(tool_name, args, _print_origin_result)
+                                    tool_result = str(_args)
+                                # if tool.function.name == 'notebook---store_intermediate_results':
+                                #     messages[-2]['content'] = f'Tool result cached to notebook with title: {args["title"]}'
+                                if 'advance_to_next_step' in tool.function.name:
+                                    content_and_system = json.loads(tool_result)
+                                    tool_result = content_and_system[0]
+                                    system = content_and_system[1]
+                                    if 'Previous main task done' in tool_result:
+                                        _messages = [messages[0]]
+                                        if messages[0]['role'] == 'system':
+                                            _messages.append(messages[1])
+                                        context.replace(_messages)
+                                        messages = context.messages
+                                    if 'Previous main task done' in tool_result:
+                                        context.append({
+                                            'role': 'user',
+                                            'content': tool_result,
+                                        })
+                                    else:
+                                        context.append({
+                                            'role': 'tool',
+                                            'content': tool_result,
+                                            'tool_call_id': tool.id,
+                                        }, stateful=key in self.stateful_servers)
+                                else:
+                                    context.append({
+                                        'role': 'tool',
+                                        'content': tool_result,
+                                        'tool_call_id': tool.id,
+                                    }, stateful=key in self.stateful_servers)
+                                _print_result = tool_result  # result.content[0].text or ''
+                                yield f'{content}\n\n tool call: {name}, {args}\n\n tool result: {_print_result}'
+                            except QueryTimeoutError:
+                                raise
+                            except Exception as e:
+                                import traceback
+                                print(traceback.format_exc())
+                                context.append({
                                     'role': 'tool',
-                                    'content': tool_result,
+                                    'content': f'Tool {name} called with error: ' + str(e),
                                     'tool_call_id': tool.id,
                                 })
-                        else:
-                            messages.append({
-                                'role': 'tool',
-                                'content': tool_result,
-                                'tool_call_id': tool.id,
-                            })
-                        _print_result = tool_result  # result.content[0].text or ''
-                        yield f'{content}\n\n tool call: {name}, {args}\n\n tool result: {_print_result}'
-                    except Exception as e:
-                        import traceback
-                        print(traceback.format_exc())
-                        messages.append({
-                            'role': 'tool',
-                            'content': f'Tool {name} called with error: ' + str(e),
-                            'tool_call_id': tool.id,
-                        })
-                    print(f'messages len: {len(str(messages))}')
-                    break
+                            break
+                    else:
+                        if content:
+                            yield content
+                        continue
+            except QueryTimeoutError:
+                yield f'Stopped: the query reached the time limit of {max_seconds:.0f} seconds.'
+
+            print(final_result)
+            if 'edgeone-pages-mcp-server' in self.sessions:
+                # our api has a problem with dealing `edgeone-pages-mcp-server`
+                # so we call it manually.
+                session = self.sessions['edgeone-pages-mcp-server']
+                response = await session.list_tools()
+                result = await self.call_tool('edgeone-pages-mcp-server', response.tools[0].name,
+                                              {'value': final_result})
+                print(result)
+        except BaseException as e:
+            if isinstance(e, GeneratorExit):
+                # Closed early, e.g. the query was cancelled in the app
+                self.trace_root.set(closed=True)
             else:
-                if content:
-                    yield content
-                continue
-
-        print(final_result)
-        if 'edgeone-pages-mcp-server' in self.sessions:
-            # our api has a problem with dealing `edgeone-pages-mcp-server`
-            # so we call it manually.
-            session = self.sessions['edgeone-pages-mcp-server']
-            response = await session.list_tools()
-            result = await session.call_tool(response.tools[0].name, {'value': final_result})
-            print(result)
+                self.trace_root.status = 'error'
+                self.trace_root.set(error=f'{type(e).__name__}: {e}')
+            raise
+        finally:
+            tracer.finish(self.trace_root)
+            print(tracer.summary(self.trace_root.trace_id))
+            print(f'tool cache: {self.cache_stats}')
+            print(f'duplicate paragraphs: {self.deduplicator.suppressed_paragraphs}, '
+                  f'suppressed bytes: {self.deduplicator.suppressed_bytes}')
+
+    def deduplicate_crawl(self, tool_result: str, url: str, tool_call_id: str) -> str:
+        """Replace the paragraphs of a crawl result already seen in this query with back-references.
+
+        This runs on the client after the tool cache, so the fingerprints stay per query even when the
+        crawl4ai server and the cache are shared by several queries. Only the paragraphs of the tool results still
+        in the context are suppressed, the ones compressed or pruned from it can be read again.
+
+        Args:
+            tool_result: The JSON output of `crawl_website`.
+            url: The crawled url, referenced by the later copies of its paragraphs.
+            tool_call_id: The id of the tool call, which the tool message holding the result refers to.
+        """
+        try:
+            output = json.loads(tool_result)
+        except json.JSONDecodeError:
+            return tool_result
+        self.deduplicator.retain({message.get('tool_call_id') for message in self.context.messages
+                                  if message['role'] == 'tool' and not self.context.is_compressed(message)})
+        output['text'], output['suppressed_bytes'] = self.deduplicator.filter(output.get('text', ''), url,
+                                                                              tool_call_id)
+        return json.dumps(output, ensure_ascii=False)
+
+    async def before_deadline(self, awaitable):
+        """Await `awaitable`, raise `QueryTimeoutError` if the query reaches its deadline first."""
+        if self.deadline is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, max(self.deadline - time.time(), 0))
+        except asyncio.TimeoutError:
+            if time.time() < self.deadline:
+                # A timeout of the awaitable itself
+                raise
+            raise QueryTimeoutError()
 
     async def connect_all_servers(self, query):
-        config = self.generate_config(self.mcp)
+        if self.recorder is not None and self.recorder.replaying:
+            # Replayed sessions do not start any server.
+            config = {name: {'command': None, 'args': []} for name in self.mcp or []}
+        else:
+            config = self.generate_config(self.mcp, inprocess=self.inprocess)
         if not self.mcp:
             keys = config.keys()
             messages = [dict(role='system',
@@ -397,12 +732,24 @@ DO NOT add any other parts like ```json which may cause parse error of json."""
         else:
             tools = self.mcp
 
+        lazy = self.lazy and self.recorder is None
+        manifest = ToolManifest(self.manifest_file) if lazy else None
         for tool in tools:
             cmd = config[tool]
-            env_dict = cmd.get('env', {})
-            env_dict = {key: value if value else os.environ.get(key, '') for key, value in env_dict.items()}
-            await self.connect_to_server(cmd['command'], cmd['args'], env_dict, server_name=tool)
+            if lazy:
+                self.sessions[tool] = LazySession(
+                    tool, cmd, functools.partial(self.open_session, cmd), manifest,
+                    idle_timeout=None if tool in self.stateful_servers else self.idle_timeout)
+                if self.current_server is None:
+                    self.current_server = tool
+                continue
+            env_dict = self.resolve_env(cmd.get('env', {}))
+            await self.connect_to_server(cmd['command'], cmd['args'], env_dict, server_name=tool,
+                                         transport=cmd.get('transport', 'stdio'))
 
     async def cleanup(self):
         """Clean up resources"""
+        for session in self.sessions.values():
+            if isinstance(session, LazySession):
+                await session.close()
         await self.exit_stack.aclose()
@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+
+from base import MCPClient
+
+
+async def crawl(profile, urls, runs):
+    """Crawl the urls with a crawl4ai server using `profile`, returns the `arun` spans it exported."""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, 'trace.jsonl')
+        config = MCPClient.generate_config(['crawl4ai'])['crawl4ai']
+        config['env'] = {**(config.get('env') or {}), 'CRAWL4AI_PROFILE': profile, 'CRAWL4AI_PRELOAD': '0',
+                         'MCP_TRACE_FILE': trace_file}
+        async with MCPClient.open_session(config) as session:
+            for _ in range(runs):
+                for url in urls:
+                    await session.call_tool('crawl_website', {'website': url})
+        if not os.path.exists(trace_file):
+            return []
+        with open(trace_file) as f:
+            spans = [json.loads(line) for line in f]
+    return [span for span in spans if span['name'] == 'arun']
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Compare the load time and transferred bytes of the pages '
+                                                 'crawled with the full and light crawl4ai profiles.')
+    parser.add_argument("--urls", type=str, nargs='+', required=True)
+    parser.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args()
+    print(f'{"profile":<8}{"pages":>6}{"load(ms)":>10}{"KB":>10}{"requests":>10}{"blocked":>9}')
+    for profile in ('full', 'light'):
+        spans = await crawl(profile, args.urls, args.runs)
+        if not spans:
+            print(f'{profile:<8}{"no page crawled":>20}')
+            continue
+        load = sum((span['endTimeUnixNano'] - span['startTimeUnixNano']) / 1e6 for span in spans) / len(spans)
+        mean = {key: sum(span['attributes'].get(key) or 0 for span in spans) / len(spans)
+                for key in ('transferred_bytes', 'requests', 'blocked_requests')}
+        print(f'{profile:<8}{len(spans):>6}{load:>10.0f}{mean["transferred_bytes"] / 1024:>10.0f}'
+              f'{mean["requests"]:>10.1f}{mean["blocked_requests"]:>9.1f}')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
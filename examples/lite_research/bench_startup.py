@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from base import MCPClient
+
+_import_time_pattern = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+async def spawn_to_list_tools(config, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        async with MCPClient.open_session(config) as session:
+            await session.list_tools()
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return latencies
+
+
+def import_times(server_file, top):
+    """The cumulative import time in ms of the server module, and of its `top` slowest top-level imports."""
+    code = f'import runpy; runpy.run_path({server_file!r})'
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True).stderr
+    modules = []
+    started = False
+    for line in output.splitlines():
+        match = _import_time_pattern.match(line)
+        if not match:
+            continue
+        # The top-level imports are not indented, the ones before runpy are the interpreter startup
+        if started and len(match.group(3)) == 1:
+            modules.append((int(match.group(2)) / 1000, match.group(4)))
+        started = started or match.group(4) == 'runpy'
+    total = sum(cumulative for cumulative, _ in modules)
+    return total, sorted(modules, reverse=True)[:top]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Measure the spawn to list_tools latency of the mcp_central servers '
+                                                 'over stdio, and the import time of their modules.')
+    parser.add_argument("--mcp", type=str, default='crawl4ai,notebook,ocrmypdf')
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help='The number of slowest imports shown per server.')
+    parser.add_argument("--max_startup_ms", type=float, default=None,
+                        help='Exit with an error if the median startup of a server is slower.')
+    args = parser.parse_args()
+    names = args.mcp.split(',')
+    # Only the mcp_central servers, not the external ones of config.json
+    configs = {name: config for name, config in MCPClient.generate_config(names).items() if name in names}
+    print(f'{"server":<12}{"p50(ms)":>10}{"max(ms)":>10}{"imports(ms)":>14}  slowest imports(ms)')
+    slow = []
+    for name, config in configs.items():
+        latencies = await spawn_to_list_tools(config, args.runs)
+        server_file = next(arg for arg in config['args'] if arg.endswith('server.py'))
+        total, modules = import_times(server_file, args.top)
+        median = statistics.median(latencies)
+        slowest = ', '.join(f'{module} {cumulative:.0f}' for cumulative, module in modules)
+        print(f'{name:<12}{median:>10.0f}{latencies[-1]:>10.0f}{total:>14.0f}  {slowest}')
+        if args.max_startup_ms is not None and median > args.max_startup_ms:
+            slow.append(name)
+    if slow:
+        print(f'Startup slower than {args.max_startup_ms:.0f}ms: {", ".join(slow)}')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
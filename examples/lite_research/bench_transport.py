@@ -0,0 +1,38 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from base import MCPClient
+
+
+async def bench(config, calls):
+    start = time.time()
+    async with MCPClient.open_session(config) as session:
+        startup = time.time() - start
+        await session.call_tool('initialize_task', {'user_query': 'benchmark', 'conditions_and_todo_list': 'none'})
+        await session.call_tool('create_execution_plan', {'plans': ['step 1', 'step 2']})
+        latencies = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            await session.call_tool('verify_task_completion', {})
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return startup, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Compare the per call latency of the notebook server '
+                                                 'over stdio and in process.')
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    print(f'{"transport":<12}{"startup(ms)":>14}{"mean(ms)":>10}{"p50(ms)":>10}{"p95(ms)":>10}')
+    for inprocess in (False, True):
+        config = MCPClient.generate_config(['notebook'], inprocess=inprocess)['notebook']
+        startup, latencies = await bench(config, args.calls)
+        print(f'{"inprocess" if inprocess else "stdio":<12}{startup * 1000:>14.1f}{statistics.mean(latencies):>10.3f}'
+              f'{latencies[len(latencies) // 2]:>10.3f}{latencies[int(len(latencies) * 0.95)]:>10.3f}')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
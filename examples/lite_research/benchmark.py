@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+
+from cache import ToolCache
+from openai import OpenAI
+from replay import Recorder, RecordStore
+from replay_server import ReplayServer
+from run import LiteResearchMCPClient
+
+
+async def run_query(idx, args, store, base_url):
+    # With a replay server the model answers over http, only the tools are replayed in process.
+    recorder = Recorder(store, 'replay', args.latency_scale, completions=base_url is None)
+    # No cache, each replayed query makes all its calls
+    client = LiteResearchMCPClient(base_url=base_url or 'http://replay', token='replay', model=args.model,
+                                   mcp=args.mcp, recorder=recorder, tool_cache=ToolCache(policies={}))
+    if base_url:
+        client.client = OpenAI(api_key='replay', base_url=base_url,
+                               default_headers={'X-Replay-Scope': str(idx)})
+    start = time.time()
+    await client.connect_all_servers(None)
+    async for _ in client.process_query(None, args.query, system=True):
+        pass
+    await client.cleanup()
+    metrics = client.context.metrics
+    usage = recorder.usage
+    if base_url:
+        usage = defaultdict(int)
+        for metric in metrics:
+            usage['prompt_tokens'] += metric.get('prompt_tokens') or 0
+            usage['completion_tokens'] += metric.get('completion_tokens') or 0
+    return {
+        'wall_time': time.time() - start,
+        'rounds': len(metrics),
+        'prompt_tokens': usage['prompt_tokens'],
+        'completion_tokens': usage['completion_tokens'],
+        'timings': recorder.timings,
+        'misses': recorder.misses,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Replay recorded lite_research runs offline and report timings. '
+                                                 'Record a run first with `python run.py --record records.jsonl`.')
+    parser.add_argument("--records", type=str, required=True)
+    parser.add_argument("--query", type=str, required=True, help='The query used when recording')
+    parser.add_argument("--model", type=str, default="claude-3-7-sonnet-20250219")
+    parser.add_argument("--mcp", type=str, nargs='+',
+                        default=['crawl4ai', 'notebook', 'web-search', 'edgeone-pages-mcp-server'])
+    parser.add_argument("--concurrency", type=int, default=1, help='Number of queries replayed at the same time')
+    parser.add_argument("--latency_scale", type=float, default=0.0,
+                        help='Replay the recorded durations scaled by this factor, 0 replays instantly')
+    parser.add_argument("--serve", action='store_true',
+                        help='Serve the model through the local OpenAI compatible replay server')
+    args = parser.parse_args()
+
+    store = RecordStore(args.records)
+    server = None
+    base_url = None
+    if args.serve:
+        server = ReplayServer(store, latency_scale=args.latency_scale)
+        base_url = server.start()
+
+    start = time.time()
+    try:
+        results = await asyncio.gather(*[run_query(idx, args, store, base_url) for idx in range(args.concurrency)])
+    finally:
+        if server is not None:
+            server.stop()
+    total = time.time() - start
+
+    wall_times = sorted(result['wall_time'] for result in results)
+    print(f'\nqueries: {len(results)}, total: {total:.2f}s, throughput: {len(results) / total:.2f} queries/s')
+    print(f'wall time p50: {statistics.median(wall_times):.2f}s, max: {wall_times[-1]:.2f}s')
+    print(f'rounds: {statistics.mean(result["rounds"] for result in results):.1f}, '
+          f'prompt tokens: {statistics.mean(result["prompt_tokens"] for result in results):.0f}, '
+          f'completion tokens: {statistics.mean(result["completion_tokens"] for result in results):.0f}, '
+          f'misses: {sum(result["misses"] for result in results) + (server.misses if server else 0)}')
+
+    timings = defaultdict(list)
+    for result in results:
+        for name, durations in result['timings'].items():
+            timings[name].extend(durations)
+    print(f'\n{"name":<45}{"calls":>8}{"total(s)":>12}{"mean(ms)":>12}')
+    for name, durations in sorted(timings.items(), key=lambda item: -sum(item[1])):
+        print(f'{name:<45}{len(durations):>8}{sum(durations):>12.2f}{statistics.mean(durations) * 1000:>12.1f}')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+def value_size(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value)
+    content = getattr(value, 'content', None)
+    if content is not None:
+        return sum(len(getattr(item, 'text', None) or '') for item in content)
+    return len(str(value))
+
+
+class ToolCache:
+    """A size-bounded LRU cache of tool results, with single-flight of identical concurrent calls.
+
+    Only the tools listed in `policies` are cached, with their TTL in seconds, so tools changing state
+    (the notebook) are never cached. Error results are not cached.
+
+    Args:
+        policies: The TTL in seconds of each cacheable tool, by `server---tool` name.
+        max_entries: The max number of cached results.
+        max_bytes: The max total size of the cached results.
+    """
+
+    default_policies = {
+        'web-search---tavily-search': 600,
+        'crawl4ai---crawl_website': 3600,
+        # The summary of a tool result for a query
+        'summary': 3600,
+    }
+
+    def __init__(self, policies: Optional[Dict[str, float]] = None, max_entries: int = 1024,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.policies = dict(self.default_policies if policies is None else policies)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict()
+        self.size = 0
+        self.in_flight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(name: str, args: Any) -> str:
+        content = json.dumps([name, args], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.size -= size
+
+    def _put(self, key: str, value: Any, ttl: float):
+        size = value_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.time() + ttl, value, size)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    async def call(self, name: str, args: Any, call: Callable[[], Awaitable[Any]],
+                   stats: Optional[Dict[str, int]] = None) -> Any:
+        """Return the cached result of `name(args)`, or call it once for all the identical concurrent calls."""
+        stats = stats if stats is not None else {}
+        ttl = self.policies.get(name)
+        if ttl is None:
+            stats['bypass'] = stats.get('bypass', 0) + 1
+            return await call()
+        key = self.key(name, args)
+        while True:
+            entry = self._get(key)
+            if entry is not None:
+                stats['hit'] = stats.get('hit', 0) + 1
+                return entry[1]
+            if key not in self.in_flight:
+                break
+            stats['coalesced'] = stats.get('coalesced', 0) + 1
+            future = self.in_flight[key]
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # This caller is cancelled
+                    raise
+                # The caller running the call is cancelled, call it again for this one
+        stats['miss'] = stats.get('miss', 0) + 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            value = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve it, so a failure without waiters is not reported as never retrieved.
+            future.exception()
+            raise
+        finally:
+            self.in_flight.pop(key, None)
+        if not getattr(value, 'isError', False):
+            self._put(key, value, ttl)
+        future.set_result(value)
+        return value
@@ -0,0 +1,117 @@
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Without tiktoken: ~4 latin characters per token, ~1 token per CJK character.
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def count_message_tokens(message: Dict[str, Any]) -> int:
+    tokens = 4 + count_tokens(message.get('content') or '')
+    for tool_call in message.get('tool_calls') or []:
+        tokens += count_tokens(tool_call.function.name) + count_tokens(tool_call.function.arguments)
+    return tokens
+
+
+class ContextManager:
+    """Keeps the message history of one query under a token budget.
+
+    Token counts are computed once per message when it is added. When the history grows over the budget,
+    the oldest tool results are replaced by a short placeholder until the history drops under
+    `low_watermark * budget`, so the compression happens in batches and the untouched prefix stays
+    byte-identical for provider-side prompt caching between two batches.
+
+    Calling a stateful tool again (e.g. `initialize_task` of the notebook clears the plan) changes its state,
+    so the placeholder of their results, appended with `stateful=True`, does not ask for a new call.
+    """
+
+    placeholder = 'Tool result removed to save context, call the tool again if you still need it.'
+
+    stateful_placeholder = 'Tool result removed to save context.'
+
+    def __init__(self, messages: List[Dict[str, Any]], budget: int = 64000, keep_recent: int = 6,
+                 low_watermark: float = 0.75):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.low_watermark = low_watermark
+        # The system prompt and the user query are never compressed.
+        self.prefix = len(messages)
+        self.messages: List[Dict[str, Any]] = []
+        self.tokens: List[int] = []
+        self.metrics: List[Dict[str, Any]] = []
+        self.compressed = 0
+        # The tool call ids of the stateful tool results
+        self.stateful_calls = set()
+        for message in messages:
+            self.append(message)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens)
+
+    def append(self, message: Dict[str, Any], stateful: bool = False):
+        if stateful:
+            self.stateful_calls.add(message.get('tool_call_id'))
+        self.messages.append(message)
+        self.tokens.append(count_message_tokens(message))
+
+    def replace(self, messages: List[Dict[str, Any]]):
+        """Replace the history, reusing the token counts of the messages which are kept."""
+        known = {id(message): tokens for message, tokens in zip(self.messages, self.tokens)}
+        self.messages = []
+        self.tokens = []
+        for message in messages:
+            self.messages.append(message)
+            self.tokens.append(known[id(message)] if id(message) in known else count_message_tokens(message))
+
+    def is_compressed(self, message: Dict[str, Any]) -> bool:
+        return message['content'] in (self.placeholder, self.stateful_placeholder)
+
+    def enforce_budget(self) -> int:
+        """Compress old tool results if the history is over budget, returns the number of compressed messages."""
+        total = self.total_tokens
+        if total <= self.budget:
+            return 0
+        target = int(self.budget * self.low_watermark)
+        compressed = 0
+        for idx in range(self.prefix, len(self.messages) - self.keep_recent):
+            if total <= target:
+                break
+            message = self.messages[idx]
+            if message['role'] != 'tool' or self.is_compressed(message):
+                continue
+            stateful = message.get('tool_call_id') in self.stateful_calls
+            placeholder = self.stateful_placeholder if stateful else self.placeholder
+            self.messages[idx] = {**message, 'content': placeholder}
+            tokens = count_message_tokens(self.messages[idx])
+            total -= self.tokens[idx] - tokens
+            self.tokens[idx] = tokens
+            compressed += 1
+        self.compressed += compressed
+        return compressed
+
+    def record_turn(self, usage: Optional[Any] = None, compressed: int = 0) -> Dict[str, Any]:
+        metric = {
+            'round': len(self.metrics) + 1,
+            'messages': len(self.messages),
+            'estimated_tokens': self.total_tokens,
+            'compressed': compressed,
+        }
+        if usage is not None:
+            metric['prompt_tokens'] = getattr(usage, 'prompt_tokens', None)
+            metric['completion_tokens'] = getattr(usage, 'completion_tokens', None)
+            details = getattr(usage, 'prompt_tokens_details', None)
+            metric['cached_tokens'] = getattr(details, 'cached_tokens', None) if details else None
+        self.metrics.append(metric)
+        return metric
@@ -0,0 +1,105 @@
+import hashlib
+import re
+from typing import Container, Dict, Hashable, List, Tuple
+
+_token_pattern = re.compile(r'[^\W_]+', re.UNICODE)
+_cjk_pattern = re.compile('[぀-ヿ㐀-䶿一-鿿가-힯]')
+
+
+def simhash(text: str, shingle: int = 2) -> int:
+    """64-bit SimHash of the word shingles of a text, CJK characters count as words."""
+    tokens = []
+    for word in _token_pattern.findall(text.lower()):
+        if _cjk_pattern.match(word):
+            tokens.extend(word)
+        else:
+            tokens.append(word)
+    shingles = [' '.join(tokens[i:i + shingle]) for i in range(max(len(tokens) - shingle + 1, 1))]
+    weights = [0] * 64
+    for item in shingles:
+        value = int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class ParagraphDeduplicator:
+    """Replaces the paragraphs already seen in a query with a short back-reference.
+
+    Each fingerprint belongs to the message (`owner`) holding its paragraph, `retain` forgets the fingerprints of
+    the messages no longer in the context, so a paragraph is only suppressed while the model can still read it.
+
+    Paragraphs are near-duplicates when the Hamming distance of their SimHash is at most `max_distance`.
+    The fingerprints are indexed by 8 bands of 8 bits: two fingerprints within 7 bits share at least one band.
+
+    Args:
+        max_distance: The max Hamming distance of two near-duplicate paragraphs, at most 7.
+        min_length: Paragraphs shorter than this (titles, list items, links) are always kept.
+    """
+
+    bands = 8
+
+    def __init__(self, max_distance: int = 6, min_length: int = 80):
+        assert max_distance < self.bands
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.index: List[Dict[int, List[Tuple[int, str, Hashable]]]] = [{} for _ in range(self.bands)]
+        self.owners = set()
+        self.suppressed_bytes = 0
+        self.suppressed_paragraphs = 0
+
+    def _band(self, fingerprint: int, band: int) -> int:
+        return fingerprint >> (band * 8) & 0xFF
+
+    def find(self, fingerprint: int):
+        """The source of a near-duplicate of `fingerprint` seen before, or None."""
+        for band in range(self.bands):
+            for other, source, _ in self.index[band].get(self._band(fingerprint, band), []):
+                if bin(fingerprint ^ other).count('1') <= self.max_distance:
+                    return source
+        return None
+
+    def add(self, fingerprint: int, source: str, owner: Hashable):
+        self.owners.add(owner)
+        for band in range(self.bands):
+            self.index[band].setdefault(self._band(fingerprint, band), []).append((fingerprint, source, owner))
+
+    def retain(self, owners: Container[Hashable]):
+        """Forget the fingerprints of the owners not in `owners`."""
+        removed = {owner for owner in self.owners if owner not in owners}
+        if not removed:
+            return
+        self.owners -= removed
+        for index in self.index:
+            for key in list(index):
+                index[key] = [entry for entry in index[key] if entry[2] not in removed]
+                if not index[key]:
+                    del index[key]
+
+    def filter(self, text: str, source: str, owner: Hashable = None) -> Tuple[str, int]:
+        """Replace the near-duplicate paragraphs of `text`, returns the new text and the suppressed bytes.
+
+        Args:
+            text: The text to filter.
+            source: The source of the text, referenced by the later copies of its paragraphs.
+            owner: The key of the message which will hold the text, the source if None.
+        """
+        owner = source if owner is None else owner
+        output = []
+        suppressed = 0
+        for paragraph in text.split('\n'):
+            if len(paragraph.strip()) < self.min_length:
+                output.append(paragraph)
+                continue
+            fingerprint = simhash(paragraph)
+            seen = self.find(fingerprint)
+            if seen is None:
+                self.add(fingerprint, source, owner)
+                output.append(paragraph)
+                continue
+            reference = f'[Duplicate of a paragraph already seen in {seen}]'
+            output.append(reference)
+            suppressed += len(paragraph.encode('utf-8')) - len(reference.encode('utf-8'))
+            self.suppressed_paragraphs += 1
+        self.suppressed_bytes += suppressed
+        return '\n'.join(output), suppressed
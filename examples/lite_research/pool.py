@@ -0,0 +1,188 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from mcp import ClientSession
+
+from base import MCPClient
+from servers import ServerProcess
+
+from mcp_central.tracing import call_tool
+
+
+class PooledSession:
+    """Forwards the calls to the current session of a process, waiting for it while it restarts."""
+
+    def __init__(self, process: ServerProcess, timeout: float = 120.0):
+        self.process = process
+        self.timeout = timeout
+
+    async def _session(self) -> ClientSession:
+        await asyncio.wait_for(self.process.ready.wait(), self.timeout)
+        return self.process.session
+
+    async def list_tools(self):
+        return await (await self._session()).list_tools()
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None):
+        return await call_tool(await self._session(), name, arguments)
+
+    async def send_ping(self):
+        return await (await self._session()).send_ping()
+
+
+class ServerPool:
+    """A process-level pool of MCP servers leased to the queries.
+
+    Stateless servers run as one shared process serving every lease concurrently. Servers holding per-query state
+    (the notebook) are leased exclusively, one process per running query. A released exclusive process still holds
+    the state of its query, so it is stopped and a fresh warm process is started for the next lease.
+    The total number of processes is capped by `max_processes`, leases wait for a free process beyond it.
+
+    Args:
+        config: The server configs, as returned by `MCPClient.generate_config`.
+        exclusive: The names of the servers leased to one query at a time.
+        max_processes: The max number of server processes of the pool.
+        health_interval: Seconds between two health pings of a process.
+    """
+
+    def __init__(self, config: Dict[str, Dict[str, Any]], exclusive: List[str] = MCPClient.stateful_servers,
+                 max_processes: int = 8, health_interval: float = 30.0):
+        self.config = config
+        self.exclusive = set(exclusive)
+        self.max_processes = max_processes
+        self.health_interval = health_interval
+        self.shared: Dict[str, ServerProcess] = {}
+        self.idle: Dict[str, List[ServerProcess]] = {}
+        # The starts in progress of `start`, awaited by the concurrent callers starting the same server
+        self.starting: Dict[str, asyncio.Task] = {}
+        self.leased = 0
+        self.closed = False
+        # The background refills of the warm exclusive processes
+        self._tasks = set()
+        self._condition = asyncio.Condition()
+
+    @property
+    def process_count(self) -> int:
+        return (len(self.shared) + sum(len(processes) for processes in self.idle.values()) + len(self.starting)
+                + self.leased)
+
+    def _process(self, name: str) -> ServerProcess:
+        return ServerProcess(name, lambda: MCPClient.open_session(self.config[name]),
+                             health_interval=self.health_interval)
+
+    async def start(self, names: List[str]):
+        """Start the shared servers and one warm process of each exclusive server.
+
+        A server already starting is awaited instead of started twice.
+        """
+        for name in names:
+            if name in self.shared or self.idle.get(name):
+                continue
+            task = self.starting.get(name)
+            if task is None:
+                if self.process_count >= self.max_processes:
+                    raise RuntimeError(f'Cannot start {name}, the pool is limited to {self.max_processes} processes')
+                task = asyncio.create_task(self._start(name))
+                self.starting[name] = task
+            # A cancelled caller does not cancel the start awaited by the others
+            await asyncio.shield(task)
+
+    async def _start(self, name: str):
+        process = self._process(name)
+        try:
+            await process.start()
+        except BaseException:
+            self.starting.pop(name, None)
+            await process.stop()
+            raise
+        self.starting.pop(name, None)
+        if self.closed:
+            await process.stop()
+        elif name in self.exclusive:
+            async with self._condition:
+                self.idle.setdefault(name, []).append(process)
+                self._condition.notify_all()
+        else:
+            self.shared[name] = process
+
+    async def _acquire(self, name: str) -> ServerProcess:
+        async with self._condition:
+            while True:
+                if self.idle.get(name):
+                    process = self.idle[name].pop()
+                    break
+                if self.process_count < self.max_processes:
+                    process = None
+                    break
+                if self._evict_idle(exclude=name):
+                    continue
+                await self._condition.wait()
+            self.leased += 1
+        if process is None:
+            process = self._process(name)
+            try:
+                await process.start()
+            except BaseException:
+                await process.stop()
+                async with self._condition:
+                    self.leased -= 1
+                    self._condition.notify_all()
+                raise
+        return process
+
+    def _evict_idle(self, exclude: str) -> bool:
+        """Stop one idle process of another exclusive server to make room, returns whether one was stopped."""
+        for name, processes in self.idle.items():
+            if name != exclude and processes:
+                asyncio.create_task(processes.pop().stop())
+                return True
+        return False
+
+    async def _release(self, process: ServerProcess):
+        # Never leased again, it holds the state of the previous query (e.g. the notebook plan and results)
+        await process.stop()
+        async with self._condition:
+            self.leased -= 1
+            self._condition.notify_all()
+        if not self.closed:
+            task = asyncio.create_task(self._refill(process.name))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, name: str):
+        """Start a fresh warm process of an exclusive server if there is room."""
+        if self.closed or self.idle.get(name) or name in self.starting or self.process_count >= self.max_processes:
+            return
+        try:
+            await self.start([name])
+        except Exception as e:
+            print(f'Cannot start a warm {name} process: {e}')
+
+    @asynccontextmanager
+    async def lease(self, names: List[str]):
+        """Lease the sessions of `names` to one query, yields a dict which can replace `MCPClient.sessions`."""
+        await self.start([name for name in names if name not in self.exclusive])
+        sessions = {}
+        leased = []
+        try:
+            for name in names:
+                if name in self.exclusive:
+                    process = await self._acquire(name)
+                    leased.append(process)
+                else:
+                    process = self.shared[name]
+                sessions[name] = PooledSession(process)
+            yield sessions
+        finally:
+            for process in leased:
+                await self._release(process)
+
+    async def close(self):
+        """Stop all the processes, the leased ones are stopped when released."""
+        self.closed = True
+        await asyncio.gather(*self.starting.values(), return_exceptions=True)
+        processes = list(self.shared.values()) + [process for processes in self.idle.values() for process in processes]
+        self.shared = {}
+        self.idle = {}
+        await asyncio.gather(*[process.stop() for process in processes])
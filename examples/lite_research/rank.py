@@ -0,0 +1,110 @@
+import math
+import re
+from collections import Counter
+from typing import List, Tuple
+
+# Kana, CJK ideographs and Hangul
+_cjk = '぀-ヿ㐀-䶿一-鿿가-힯'
+_word_pattern = re.compile(f'[a-z0-9]+|[{_cjk}]+')
+_cjk_pattern = re.compile(f'[{_cjk}]')
+_sentence_pattern = re.compile(r'(?<=[.!?。！？；;])\s*')
+
+_stop_words = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'how', 'in', 'is', 'it', 'of',
+               'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'with'}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased latin words, and bigrams of CJK runs which have no spaces between words."""
+    tokens = []
+    for word in _word_pattern.findall(text.lower()):
+        if _cjk_pattern.match(word):
+            tokens.extend([word] if len(word) == 1 else [word[i:i + 2] for i in range(len(word) - 1)])
+        elif word not in _stop_words:
+            tokens.append(word)
+    return tokens
+
+
+def bm25_scores(query: str, passages: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    query_tokens = set(tokenize(query))
+    documents = [Counter(tokenize(passage)) for passage in passages]
+    if not documents or not query_tokens:
+        return [0.0] * len(passages)
+    avg_length = sum(sum(document.values()) for document in documents) / len(documents) or 1
+    idf = {}
+    for token in query_tokens:
+        containing = sum(1 for document in documents if token in document)
+        idf[token] = math.log(1 + (len(documents) - containing + 0.5) / (containing + 0.5))
+    scores = []
+    for document in documents:
+        length = sum(document.values())
+        score = 0.0
+        for token in query_tokens:
+            frequency = document.get(token)
+            if not frequency:
+                continue
+            score += idf[token] * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / avg_length))
+        scores.append(score)
+    return scores
+
+
+def split_passages(content: str, passage_size: int = 600) -> List[Tuple[str, str]]:
+    """Split a search result into (header, passage) pairs.
+
+    Each `Title:` block of the result is a search hit, its title and url lines are kept as the header of all
+    the passages cut from its content, so a selected passage keeps its source.
+    """
+    passages = []
+    for block in re.split(r'\n\s*\n', content):
+        block = block.strip()
+        if not block:
+            continue
+        header = ''
+        body = block
+        if block.startswith('Title:'):
+            lines = block.split('\n')
+            header_lines = [line for line in lines if line.startswith(('Title:', 'URL:'))]
+            header = '\n'.join(header_lines)
+            body = '\n'.join(line for line in lines if line not in header_lines)
+        window = ''
+        for sentence in _sentence_pattern.split(body):
+            if window and len(window) + len(sentence) > passage_size:
+                passages.append((header, window.strip()))
+                window = ''
+            window += sentence + ' '
+        if window.strip():
+            passages.append((header, window.strip()))
+    return passages
+
+
+def select_passages(query: str, content: str, budget: int, min_ratio: float = 0.1) -> str:
+    """Keep the passages of `content` most relevant to `query` within `budget` characters.
+
+    Passages scoring under `min_ratio` of the best BM25 score are dropped, the others are packed best first
+    and written back in their original order. If no passage matches the query at all, nothing can be ranked
+    and the content is only cut to the budget.
+    """
+    passages = split_passages(content)
+    scores = bm25_scores(query, [header + '\n' + passage for header, passage in passages])
+    best = max(scores, default=0.0)
+    if best <= 0:
+        return content[:budget]
+    selected = set()
+    used = 0
+    for idx in sorted(range(len(passages)), key=lambda idx: -scores[idx]):
+        if scores[idx] < best * min_ratio:
+            break
+        header, passage = passages[idx]
+        size = len(passage) + len(header) + 2
+        if used + size > budget:
+            continue
+        selected.add(idx)
+        used += size
+    output = []
+    last_header = None
+    for idx in sorted(selected):
+        header, passage = passages[idx]
+        if header != last_header:
+            output.append(f'\n{header}' if header else '')
+            last_header = header
+        output.append(passage)
+    return '\n'.join(output).strip()
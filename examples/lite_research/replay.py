@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from mcp.types import CallToolResult, ListToolsResult
+from openai.types.chat import ChatCompletion
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from mcp_central.tracing import call_tool  # noqa: E402
+
+# Dates in the system prompt change every day, they are not part of the request identity.
+_date_pattern = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def _default(obj):
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump()
+    return str(obj)
+
+
+def _drop_none(obj):
+    if isinstance(obj, dict):
+        return {key: _drop_none(value) for key, value in obj.items() if value is not None}
+    if isinstance(obj, list):
+        return [_drop_none(value) for value in obj]
+    return obj
+
+
+def request_key(kind: str, request: Any) -> str:
+    """A stable hash of a request, used to match a replayed request with its recording.
+
+    The request is normalized through json and the None values are dropped, so the same request hashes
+    equally whether it is built in the client or parsed from an http body.
+    """
+    request = _drop_none(json.loads(json.dumps(request, ensure_ascii=False, default=_default)))
+    content = json.dumps([kind, request], sort_keys=True, ensure_ascii=False)
+    content = _date_pattern.sub('<date>', content)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class RecordStore:
+    """A JSONL file of recorded responses, shared by all the clients of one process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records[record['key']] = record
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.records.get(key)
+
+    def put(self, key: str, kind: str, response: Any, elapsed: float):
+        record = {'key': key, 'kind': kind, 'response': response, 'elapsed': elapsed}
+        with self._lock:
+            self.records[key] = record
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=_default) + '\n')
+
+
+class Recorder:
+    """Records or replays the model and tool responses of one client.
+
+    The same request may be sent several times in one run with different answers (the notebook tools are
+    stateful), so the n-th occurrence of a request is matched with the n-th recording of it. When a replayed
+    request occurs more often than it was recorded, the last recording is reused.
+
+    Args:
+        store: The record store.
+        mode: `record` to call the real endpoints and save the responses, `replay` to answer from the store only.
+        latency_scale: In replay mode, sleep `latency_scale` times the recorded duration of each response,
+            0 replays instantly.
+        completions: Whether the model responses go through this recorder, set it to False when the model
+            is served by the replay server.
+    """
+
+    def __init__(self, store: RecordStore, mode: str = 'replay', latency_scale: float = 0.0,
+                 completions: bool = True):
+        assert mode in ('record', 'replay'), f'Unknown mode: {mode}'
+        self.store = store
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.completions = completions
+        self.occurrences = defaultdict(int)
+        self.misses = 0
+        # Durations of every call by tool name (or `completion`), and the token usage of the completions
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.usage: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def _next_key(self, kind: str, request: Any) -> str:
+        base = request_key(kind, request)
+        with self._lock:
+            idx = self.occurrences[base]
+            self.occurrences[base] += 1
+        if self.replaying:
+            while idx > 0 and self.store.get(f'{base}#{idx}') is None:
+                idx -= 1
+        return f'{base}#{idx}'
+
+    def _lookup(self, key: str) -> Dict[str, Any]:
+        record = self.store.get(key)
+        if record is None:
+            self.misses += 1
+            raise KeyError(f'No recording for request {key}, record this query again.')
+        return record
+
+    def completion(self, request: Dict[str, Any], create: Callable[[], ChatCompletion]) -> ChatCompletion:
+        key = self._next_key('completion', request)
+        start = time.time()
+        if self.replaying:
+            record = self._lookup(key)
+            if self.latency_scale:
+                time.sleep(record['elapsed'] * self.latency_scale)
+            completion = ChatCompletion.model_validate(record['response'])
+        else:
+            completion = create()
+            self.store.put(key, 'completion', completion.model_dump(), time.time() - start)
+        self.timings['completion'].append(time.time() - start)
+        if completion.usage is not None:
+            self.usage['prompt_tokens'] += completion.usage.prompt_tokens or 0
+            self.usage['completion_tokens'] += completion.usage.completion_tokens or 0
+        return completion
+
+    async def call(self, kind: str, request: List[Any], call, response_type):
+        key = self._next_key(kind, request)
+        start = time.time()
+        if self.replaying:
+            record = self._lookup(key)
+            if self.latency_scale:
+                await asyncio.sleep(record['elapsed'] * self.latency_scale)
+            response = response_type.model_validate(record['response'])
+        else:
+            response = await call()
+            self.store.put(key, kind, response.model_dump(), time.time() - start)
+        if kind == 'call_tool':
+            self.timings['---'.join(request[:2])].append(time.time() - start)
+        return response
+
+
+class RecordingSession:
+    """Wraps a `ClientSession` to record its responses, or replaces it when replaying."""
+
+    def __init__(self, recorder: Recorder, server_name: str, session=None):
+        self.recorder = recorder
+        self.server_name = server_name
+        self.session = session
+
+    async def list_tools(self) -> ListToolsResult:
+        return await self.recorder.call('list_tools', [self.server_name],
+                                        lambda: self.session.list_tools(), ListToolsResult)
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None) -> CallToolResult:
+        return await self.recorder.call('call_tool', [self.server_name, name, arguments],
+                                        lambda: call_tool(self.session, name, arguments), CallToolResult)
+
+    async def send_ping(self):
+        if self.session is not None:
+            return await self.session.send_ping()
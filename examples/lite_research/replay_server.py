@@ -0,0 +1,127 @@
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from replay import Recorder, RecordStore
+
+
+class ReplayServer:
+    """A local OpenAI compatible server which answers `/chat/completions` from a record store.
+
+    Requests are matched with the same key as `Recorder`, the occurrence counters are kept per
+    `X-Replay-Scope` header so concurrent replays of the same query do not interfere. A request without
+    recording is answered with `<task_done>` so the agent loop ends instead of retrying.
+
+    Args:
+        store: The record store.
+        host: The host to bind.
+        port: The port to bind, 0 picks a free one.
+        latency_scale: Sleep `latency_scale` times the recorded duration before answering.
+    """
+
+    def __init__(self, store: RecordStore, host: str = '127.0.0.1', port: int = 0, latency_scale: float = 0.0):
+        self.store = store
+        self.latency_scale = latency_scale
+        self.recorders: Dict[str, Recorder] = {}
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def recorder(self, scope: str) -> Recorder:
+        with self._lock:
+            if scope not in self.recorders:
+                self.recorders[scope] = Recorder(self.store, 'replay', self.latency_scale)
+            return self.recorders[scope]
+
+    def complete(self, body: Dict, scope: str) -> Dict:
+        body.pop('stream', None)
+        try:
+            return self.recorder(scope).completion(body, None).model_dump()
+        except KeyError as e:
+            print(str(e))
+            self.misses += 1
+            return {
+                'id': f'replay-{uuid.uuid4().hex}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', ''),
+                'choices': [{
+                    'index': 0,
+                    'finish_reason': 'stop',
+                    'message': {'role': 'assistant', 'content': '<task_done>'},
+                }],
+            }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _send(self, status, payload):
+                content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                if self.path.endswith('/models'):
+                    models = {record['response']['model'] for record in server.store.records.values()
+                              if record['kind'] == 'completion'}
+                    self._send(200, {'object': 'list',
+                                     'data': [{'id': model, 'object': 'model'} for model in sorted(models)]})
+                else:
+                    self._send(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+            def do_POST(self):
+                if not self.path.endswith('/chat/completions'):
+                    self._send(404, {'error': {'message': f'Unknown path {self.path}'}})
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length))
+                scope = self.headers.get('X-Replay-Scope', 'default')
+                self._send(200, server.complete(body, scope))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=str, required=True)
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency_scale", type=float, default=0.0)
+    args = parser.parse_args()
+    server = ReplayServer(RecordStore(args.records), args.host, args.port, args.latency_scale)
+    print(f'Replay server listening on {server.base_url}')
+    try:
+        server.httpd.serve_forever()
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
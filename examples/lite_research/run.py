@@ -3,6 +3,7 @@ import argparse
 import os
 from datetime import datetime
 from base import MCPClient
+from replay import Recorder, RecordStore
 
 
 class LiteResearchMCPClient(MCPClient):
@@ -66,11 +67,21 @@ async def main():
     parser.add_argument("--base_url", type=str, default="https://dashscope.aliyuncs.com/compatible-mode/v1")
     parser.add_argument("--model", type=str, default="claude-3-7-sonnet-20250219")
     parser.add_argument("--token", type=str, default="")
+    parser.add_argument("--record", type=str, default=None,
+                        help='Record the model and tool responses to this file, replay them with benchmark.py')
+    parser.add_argument("--lazy", action='store_true',
+                        help='Start each MCP server on its first tool call, and stop it when idle')
+    parser.add_argument("--idle_timeout", type=float, default=300.0)
+    parser.add_argument("--inprocess", action='store_true',
+                        help='Run the FastMCP servers of mcp_central in this process instead of stdio subprocesses')
     args = parser.parse_args()
     if not args.token:
         args.token = os.environ.get('MODEL_TOKEN', '')
+    recorder = Recorder(RecordStore(args.record), 'record') if args.record else None
     client = LiteResearchMCPClient(base_url=args.base_url, token=args.token, model=args.model,
-                                   mcp=['crawl4ai', 'notebook', 'web-search', 'edgeone-pages-mcp-server'])
+                                   mcp=['crawl4ai', 'notebook', 'web-search', 'edgeone-pages-mcp-server'],
+                                   recorder=recorder, lazy=args.lazy, idle_timeout=args.idle_timeout,
+                                   inprocess=args.inprocess)
     try:
         user_input = input('>>> Please input your query:')
         await client.connect_all_servers(None)
@@ -0,0 +1,115 @@
+import asyncio
+import itertools
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Ticket:
+
+    def __init__(self, user: str):
+        self.user = user
+        self.admitted = asyncio.Event()
+
+
+class QueryScheduler:
+    """Admission control in front of `process_query`.
+
+    At most `max_concurrent` queries run at the same time, at most `max_queue` wait for their turn and the
+    others are rejected. Waiting queries are admitted round-robin between the users, so one user submitting
+    many queries does not delay the others: the next admitted query is the one of the user served least recently.
+    One user runs at most `max_per_user` queries at a time.
+
+    Args:
+        max_concurrent: The max number of queries running at the same time.
+        max_queue: The max number of queries waiting.
+        max_per_user: The max number of queries of one user running at the same time.
+        max_rounds: The max model rounds of one query, passed to `process_query`.
+        max_seconds: The max wall time of one query in seconds, passed to `process_query`.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 32, max_per_user: int = 1,
+                 max_rounds: int = 60, max_seconds: float = 1800):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.max_rounds = max_rounds
+        self.max_seconds = max_seconds
+        self.waiting: Dict[str, Deque[Ticket]] = {}
+        self.running: Dict[str, int] = {}
+        # The admission sequence number of the last query of each active user
+        self.served: Dict[str, int] = {}
+        self._sequence = itertools.count()
+
+    @property
+    def waiting_count(self) -> int:
+        return sum(len(tickets) for tickets in self.waiting.values())
+
+    @property
+    def running_count(self) -> int:
+        return sum(self.running.values())
+
+    def submit(self, user: str) -> Ticket:
+        if self.waiting_count >= self.max_queue:
+            raise QueueFullError('Too many queries are waiting, please retry later.')
+        ticket = Ticket(user)
+        self.waiting.setdefault(user, deque()).append(ticket)
+        self._dispatch()
+        return ticket
+
+    def _rotation(self) -> List[str]:
+        """The waiting users, least recently served first."""
+        return sorted(self.waiting, key=lambda user: self.served.get(user, -1))
+
+    def _order(self) -> List[Ticket]:
+        """The waiting tickets in the order they will be admitted."""
+        queues = [list(self.waiting[user]) for user in self._rotation()]
+        return [ticket for group in itertools.zip_longest(*queues) for ticket in group if ticket is not None]
+
+    def _dispatch(self):
+        while self.running_count < self.max_concurrent:
+            user = next((user for user in self._rotation() if self.running.get(user, 0) < self.max_per_user), None)
+            if user is None:
+                return
+            ticket = self.waiting[user].popleft()
+            if not self.waiting[user]:
+                self.waiting.pop(user)
+            self.running[user] = self.running.get(user, 0) + 1
+            self.served[user] = next(self._sequence)
+            ticket.admitted.set()
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based position of a waiting ticket, 0 when admitted."""
+        if ticket.admitted.is_set():
+            return 0
+        return self._order().index(ticket) + 1
+
+    async def wait(self, ticket: Ticket, interval: float = 1.0) -> AsyncIterator[int]:
+        """Yield the position of the ticket each time it changes, until it is admitted."""
+        last = None
+        while not ticket.admitted.is_set():
+            position = self.position(ticket)
+            if position != last:
+                last = position
+                yield position
+            try:
+                await asyncio.wait_for(ticket.admitted.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, ticket: Ticket):
+        """Release a running ticket or withdraw a waiting one."""
+        if ticket.admitted.is_set():
+            self.running[ticket.user] -= 1
+            if not self.running[ticket.user]:
+                self.running.pop(ticket.user)
+                if ticket.user not in self.waiting:
+                    self.served.pop(ticket.user, None)
+        elif ticket.user in self.waiting:
+            self.waiting[ticket.user].remove(ticket)
+            if not self.waiting[ticket.user]:
+                self.waiting.pop(ticket.user)
+        self._dispatch()
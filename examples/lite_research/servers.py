@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, AsyncContextManager, Callable, Dict, Optional
+
+from mcp import ClientSession
+from mcp.types import ListToolsResult
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from mcp_central.tracing import call_tool  # noqa: E402
+
+SessionFactory = Callable[[], AsyncContextManager[ClientSession]]
+
+
+class ServerProcess:
+    """One MCP server and its session, owned by a supervisor task.
+
+    The stdio transport must be entered and exited in the same task, so the supervisor task keeps the session
+    open, pings it every `health_interval` seconds, and restarts the server with an exponential backoff when
+    it crashes or stops answering.
+
+    Args:
+        name: The server name.
+        open_session: A factory of async context managers yielding an initialized session,
+            see `MCPClient.open_session`.
+    """
+
+    def __init__(self, name: str, open_session: SessionFactory, health_interval: float = 30.0,
+                 ping_timeout: float = 10.0, max_backoff: float = 60.0):
+        self.name = name
+        self.open_session = open_session
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.max_backoff = max_backoff
+        self.session: Optional[ClientSession] = None
+        self.restarts = 0
+        self.error: Optional[Exception] = None
+        self.ready = asyncio.Event()
+        self._attempted = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self, timeout: float = 120.0):
+        """Start the server and wait for its session, raise if the first start fails."""
+        if self._task is None:
+            self._closing.clear()
+            self._attempted.clear()
+            self._task = asyncio.create_task(self._supervise())
+        await asyncio.wait_for(self._attempted.wait(), timeout)
+        if not self.ready.is_set():
+            await self.stop()
+            raise RuntimeError(f'Cannot start server {self.name}: {self.error}')
+
+    async def _supervise(self):
+        backoff = 1.0
+        while not self._closing.is_set():
+            try:
+                async with self.open_session() as session:
+                    self.session = session
+                    self.ready.set()
+                    self._attempted.set()
+                    backoff = 1.0
+                    while True:
+                        try:
+                            await asyncio.wait_for(self._closing.wait(), self.health_interval)
+                            break
+                        except asyncio.TimeoutError:
+                            pass
+                        await asyncio.wait_for(session.send_ping(), self.ping_timeout)
+            except Exception as e:
+                self.error = e
+                print(f'Server {self.name} failed: {e}')
+            self.session = None
+            self.ready.clear()
+            if self._closing.is_set() or not self._attempted.is_set():
+                # Stopped, or the first start failed and `start` reports it.
+                self._attempted.set()
+                break
+            self.restarts += 1
+            print(f'Restarting server {self.name} in {backoff:.0f}s')
+            try:
+                await asyncio.wait_for(self._closing.wait(), backoff)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def stop(self):
+        self._closing.set()
+        if self._task is not None:
+            task, self._task = self._task, None
+            await task
+
+
+class ToolManifest:
+    """A JSON file caching the `list_tools` result of each server.
+
+    An entry is valid while the command, the args and the modification time of the files in the args
+    (e.g. the server.py) are unchanged.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(config: Dict[str, Any]) -> str:
+        args = config.get('args') or []
+        mtimes = [os.path.getmtime(arg) for arg in args if isinstance(arg, str) and os.path.isfile(arg)]
+        content = json.dumps([config.get('command'), args, mtimes], sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _load(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def get(self, name: str, config: Dict[str, Any]) -> Optional[ListToolsResult]:
+        entry = self._load().get(name)
+        if entry is None or entry['fingerprint'] != self.fingerprint(config):
+            return None
+        return ListToolsResult.model_validate(entry['tools'])
+
+    def put(self, name: str, config: Dict[str, Any], tools: ListToolsResult):
+        with self._lock:
+            content = self._load()
+            content[name] = {'fingerprint': self.fingerprint(config), 'tools': tools.model_dump(mode='json')}
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump(content, f, ensure_ascii=False)
+
+
+class LazySession:
+    """A session which lists the tools from the manifest, and spawns its server on the first tool call.
+
+    The server is shut down after `idle_timeout` seconds without a call, and spawned again on the next one.
+    `idle_timeout=None` keeps it running once started, for servers holding state between calls.
+    """
+
+    def __init__(self, name: str, config: Dict[str, Any], open_session: SessionFactory, manifest: ToolManifest,
+                 idle_timeout: Optional[float] = 300.0):
+        self.name = name
+        self.config = config
+        self.manifest = manifest
+        self.idle_timeout = idle_timeout
+        self.process = ServerProcess(name, open_session)
+        self.in_flight = 0
+        self.last_used = time.time()
+        self._lock = asyncio.Lock()
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def _session(self) -> ClientSession:
+        async with self._lock:
+            if not self.process.running:
+                await self.process.start()
+                if self.idle_timeout is not None and self._watcher is None:
+                    self._watcher = asyncio.create_task(self._watch_idle())
+        await asyncio.wait_for(self.process.ready.wait(), 120)
+        return self.process.session
+
+    async def _watch_idle(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout - (time.time() - self.last_used), 1))
+            async with self._lock:
+                if (self.process.running and not self.in_flight
+                        and time.time() - self.last_used >= self.idle_timeout):
+                    print(f'Server {self.name} idle for {self.idle_timeout:.0f}s, shutting down')
+                    await self.process.stop()
+                    self._watcher = None
+                    return
+
+    async def list_tools(self) -> ListToolsResult:
+        tools = self.manifest.get(self.name, self.config)
+        if tools is None:
+            tools = await self._call(lambda session: session.list_tools())
+            self.manifest.put(self.name, self.config, tools)
+        return tools
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None):
+        return await self._call(lambda session: call_tool(session, name, arguments))
+
+    async def send_ping(self):
+        if self.process.running:
+            return await self._call(lambda session: session.send_ping())
+
+    async def _call(self, call):
+        self.in_flight += 1
+        try:
+            return await call(await self._session())
+        finally:
+            self.in_flight -= 1
+            self.last_used = time.time()
+
+    async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        await self.process.stop()
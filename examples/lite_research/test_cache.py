@@ -0,0 +1,30 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from cache import ToolCache  # noqa: E402
+
+
+def test_cancelled_caller_does_not_cancel_waiters():
+
+    async def run():
+        cache = ToolCache()
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        first = asyncio.create_task(cache.call('summary', ['query'], call))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cache.call('summary', ['query'], call)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await asyncio.gather(*waiters) == ['result'] * 3
+        assert first.cancelled()
+        # One waiter called it again for all of them
+        assert len(calls) == 2
+
+    asyncio.run(run())
@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dedup import ParagraphDeduplicator  # noqa: E402
+
+paragraph = ('Research runs often crawl mirrors, syndicated articles and paginated copies of the same content, '
+             'and every copy is fed to the model again.')
+
+
+def test_near_duplicates_are_suppressed():
+    deduplicator = ParagraphDeduplicator()
+    assert deduplicator.filter(paragraph, 'https://a.com') == (paragraph, 0)
+    text, suppressed = deduplicator.filter('# Mirror\n' + paragraph.upper(), 'https://b.com')
+    assert text == '# Mirror\n[Duplicate of a paragraph already seen in https://a.com]'
+    assert suppressed > 0
+
+
+def test_retain_forgets_removed_messages():
+    deduplicator = ParagraphDeduplicator()
+    deduplicator.filter(paragraph, 'https://a.com', 'call_1')
+    deduplicator.retain({'call_1'})
+    assert deduplicator.filter(paragraph, 'https://a.com', 'call_2')[1] > 0
+    # The result of call_1 was compressed out of the context
+    deduplicator.retain({'call_2'})
+    assert deduplicator.filter(paragraph, 'https://a.com', 'call_3') == (paragraph, 0)
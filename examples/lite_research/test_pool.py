@@ -0,0 +1,103 @@
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from pool import ServerPool  # noqa: E402
+from servers import ServerProcess  # noqa: E402
+
+
+class FakeSession:
+    """Holds some state, like the notebook of a query."""
+
+    def __init__(self):
+        self.state = {}
+
+    async def send_ping(self):
+        pass
+
+
+class FakeServerPool(ServerPool):
+    """A pool whose processes are fake sessions taking some time to start, counted by server name."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spawned = {}
+        self.alive = {}
+
+    def _process(self, name: str) -> ServerProcess:
+
+        @asynccontextmanager
+        async def open_session():
+            self.spawned[name] = self.spawned.get(name, 0) + 1
+            self.alive[name] = self.alive.get(name, 0) + 1
+            try:
+                await asyncio.sleep(0.05)
+                yield FakeSession()
+            finally:
+                self.alive[name] -= 1
+
+        return ServerProcess(name, open_session, health_interval=self.health_interval)
+
+
+def test_concurrent_leases():
+
+    async def run():
+        pool = FakeServerPool({'crawl4ai': {}, 'notebook': {}}, exclusive=['notebook'], max_processes=8)
+
+        async def query():
+            async with pool.lease(['crawl4ai', 'notebook']) as sessions:
+                assert set(sessions) == {'crawl4ai', 'notebook'}
+                assert pool.process_count == sum(pool.alive.values())
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(*[query() for _ in range(4)])
+        # Let the warm notebook process start
+        await asyncio.sleep(0.2)
+        assert pool.spawned['crawl4ai'] == 1
+        assert pool.alive == {'crawl4ai': 1, 'notebook': 1}
+        assert pool.process_count == 2
+        await pool.close()
+        assert sum(pool.alive.values()) == 0
+
+    asyncio.run(run())
+
+
+def test_process_cap():
+
+    async def run():
+        pool = FakeServerPool({'crawl4ai': {}, 'notebook': {}}, exclusive=['notebook'], max_processes=3)
+        max_alive = 0
+
+        async def query():
+            nonlocal max_alive
+            async with pool.lease(['crawl4ai', 'notebook']):
+                max_alive = max(max_alive, sum(pool.alive.values()))
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(*[query() for _ in range(6)])
+        assert pool.spawned['crawl4ai'] == 1
+        assert max_alive <= 3
+        await pool.close()
+        assert sum(pool.alive.values()) == 0
+
+    asyncio.run(run())
+
+
+def test_exclusive_process_is_not_leased_again():
+
+    async def run():
+        pool = FakeServerPool({'notebook': {}}, exclusive=['notebook'], max_processes=2)
+        async with pool.lease(['notebook']) as sessions:
+            session = sessions['notebook'].process.session
+            session.state['task'] = 'the query of the first user'
+        await asyncio.sleep(0.2)
+        async with pool.lease(['notebook']) as sessions:
+            assert sessions['notebook'].process.session is not session
+            assert sessions['notebook'].process.session.state == {}
+        await pool.close()
+        await asyncio.sleep(0.1)
+        assert sum(pool.alive.values()) == 0
+
+    asyncio.run(run())
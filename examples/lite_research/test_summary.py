@@ -0,0 +1,36 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from base import MCPClient  # noqa: E402
+from cache import ToolCache  # noqa: E402
+
+
+def test_split_content():
+    assert MCPClient.split_content('', 10) == ['']
+    assert MCPClient.split_content('aaa\n\nbbb\n\nccc', 8) == ['aaa\n\nbbb', 'ccc']
+    # A paragraph longer than a chunk is cut
+    assert MCPClient.split_content('a' * 25, 10) == ['a' * 10, 'a' * 10, 'a' * 5]
+    chunks = MCPClient.split_content('\n\n'.join(['x' * 30] * 10), 100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert '\n\n'.join(chunks) == '\n\n'.join(['x' * 30] * 10)
+
+
+def test_summary_stops_at_max_depth():
+
+    class Client(MCPClient):
+        summary_chunk_size = 1000
+        summary_max_depth = 2
+
+        async def _summary_call(self, prompt, query, content, **kwargs):
+            # The partial summaries never shrink
+            return json.dumps({'title': 'title', 'summary': 's' * 600, 'status': 'success'})
+
+    client = Client('http://localhost', 'token', 'model', [], tool_cache=ToolCache(policies={}))
+    result = json.loads(asyncio.run(client.summary('query', '\n\n'.join(['c' * 900] * 4))))
+    assert set(result) == {'title', 'summary', 'status'}
+    assert result['title'] == 'title'
+    assert result['status'] == 'success'
+    assert len(result['summary']) == Client.summary_chunk_size
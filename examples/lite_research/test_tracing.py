@@ -0,0 +1,34 @@
+import asyncio
+import os
+import sys
+
+from fastmcp import FastMCP
+from fastmcp.client.transports import FastMCPTransport
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from base import tracer  # noqa: E402
+from mcp_central.tracing import Span, Tracer, call_tool  # noqa: E402
+
+
+def test_server_span_is_a_child_of_the_client_span():
+    server_tracer = Tracer('echo')
+    mcp = FastMCP('echo')
+
+    @mcp.tool()
+    @server_tracer.traced()
+    async def echo(text: str) -> str:
+        return text
+
+    async def run():
+        # Connected outside of any span, the server tasks do not inherit a client span
+        async with FastMCPTransport(mcp).connect_session() as session:
+            root = Span('process_query', tracer.service)
+            with tracer.span('call_tool', default_parent=root) as span:
+                result = await call_tool(session, 'echo', {'text': 'hello'})
+            tracer.finish(root)
+        assert not result.isError
+        server_span = next(s for s in server_tracer.spans if s.service == 'echo' and s.trace_id == root.trace_id)
+        assert server_span.parent_id == span.span_id
+        assert 'echo' in tracer.summary(root.trace_id)
+
+    asyncio.run(run())
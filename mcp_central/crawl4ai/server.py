@@ -1,44 +1,171 @@
+import asyncio
+import functools
 import json
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
 
-import trafilatura
-from crawl4ai import *
-from crawl4ai.async_crawler_strategy import AsyncPlaywrightCrawlerStrategy
-from crawl4ai.browser_manager import BrowserManager
 from fastmcp import FastMCP
 
-mcp = FastMCP("crawl4ai")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from mcp_central.tracing import Tracer  # noqa: E402
 
+tracer = Tracer("crawl4ai")
 
-async def __aexit__(self, exc_type, exc_val, exc_tb):
-    await self.close()
-    # Fix: https://github.com/unclecode/crawl4ai/issues/842
-    BrowserManager._playwright_instance = None
 
+@functools.lru_cache(maxsize=None)
+def load_crawler():
+    """Import crawl4ai, Playwright and trafilatura.
 
-AsyncPlaywrightCrawlerStrategy.__aexit__ = __aexit__
+    They take seconds to import, so they are imported on the first crawl (or by `preload`) instead of before
+    the server can answer `initialize`.
+    """
+    import trafilatura
+    from crawl4ai import AsyncWebCrawler, CrawlerRunConfig
+    from crawl4ai.async_crawler_strategy import AsyncPlaywrightCrawlerStrategy
+    from crawl4ai.browser_manager import BrowserManager
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+        # Fix: https://github.com/unclecode/crawl4ai/issues/842
+        BrowserManager._playwright_instance = None
+
+    AsyncPlaywrightCrawlerStrategy.__aexit__ = __aexit__
+    return AsyncWebCrawler, CrawlerRunConfig, trafilatura
+
+
+def _preload():
+    start = time.time()
+    try:
+        load_crawler()
+        print(f'crawl4ai preloaded in {time.time() - start:.2f}s', file=sys.stderr)
+    except Exception as e:
+        # Reported again by the first crawl
+        print(f'Cannot preload crawl4ai: {e}', file=sys.stderr)
+
+
+# Read at load time, like the other settings, so an in-process server gets the one of its config
+PRELOAD = os.environ.get('CRAWL4AI_PRELOAD', '1') != '0'
+
+
+@asynccontextmanager
+async def preload(server):
+    """Import the crawler in a thread once the server is serving, unless `CRAWL4AI_PRELOAD=0`."""
+    task = None
+    if PRELOAD:
+        task = asyncio.create_task(asyncio.to_thread(_preload))
+    try:
+        yield
+    finally:
+        if task is not None and not task.done():
+            task.cancel()
+
+
+mcp = FastMCP("crawl4ai", lifespan=preload)
+
+# `light` blocks the resources not needed to extract the page, `full` loads the page as a browser does
+CRAWL_PROFILE = os.environ.get('CRAWL4AI_PROFILE', 'light')
+
+# Media urls and descriptions are read from the DOM, the files themselves are never needed
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font', 'stylesheet', 'texttrack', 'eventsource', 'websocket', 'manifest'}
+
+BLOCKED_HOSTS = {
+    'doubleclick.net', 'googlesyndication.com', 'googleadservices.com', 'google-analytics.com',
+    'googletagmanager.com', 'googletagservices.com', 'adservice.google.com', 'amazon-adsystem.com',
+    'facebook.net', 'connect.facebook.net', 'scorecardresearch.com', 'quantserve.com', 'hotjar.com',
+    'criteo.com', 'criteo.net', 'taboola.com', 'outbrain.com', 'adnxs.com', 'rubiconproject.com',
+    'pubmatic.com', 'segment.io', 'segment.com', 'mixpanel.com', 'newrelic.com', 'nr-data.net',
+    'hm.baidu.com', 'cnzz.com', 'umeng.com', 'mmstat.com',
+}
+
+
+def is_blocked_host(url: str) -> bool:
+    host = urlparse(url).hostname or ''
+    parts = host.split('.')
+    return any('.'.join(parts[i:]) in BLOCKED_HOSTS for i in range(len(parts) - 1))
+
+
+# Only the first 2048 characters of the extracted text are returned, so in the light profile the page is ready
+# once it is interactive (DOMContentLoaded), or earlier once this much text is rendered.
+EARLY_TEXT_LENGTH = 10000
+
+LIGHT_READY_CONDITION = (f"js:() => document.readyState !== 'loading' || "
+                         f"(!!document.body && document.body.innerText.length >= {EARLY_TEXT_LENGTH})")
+
+# Milliseconds, crawl4ai waits 60 seconds by default
+LIGHT_PAGE_TIMEOUT = 20000
+
+
+def profile_hook(stats, block: bool):
+    """A hook counting the requests and transferred bytes of a page in `stats`.
+
+    With `block`, the heavy resources and the ad or analytics requests are aborted and counted as blocked.
+    """
+
+    async def route(route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or is_blocked_host(request.url):
+            stats['blocked_requests'] += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def on_request_finished(request):
+        stats['requests'] += 1
+        try:
+            sizes = await request.sizes()
+            stats['transferred_bytes'] += sizes['responseHeadersSize'] + sizes['responseBodySize']
+        except Exception:
+            pass
+
+    async def on_page_context_created(page, **kwargs):
+        page.on('requestfinished', on_request_finished)
+        if block:
+            await page.route('**/*', route)
+        return page
+
+    return on_page_context_created
 
 
 @mcp.tool(description='A crawl tool to get the content of a website page, '
                       'and simplify the content to pure html content. This tool can be used to get the detail '
                       'information in the url')
+@tracer.traced()
 async def crawl_website(website: str) -> str:
     if not website.startswith('http'):
         website = 'http://' + website
     try:
+        with tracer.span('load_crawler'):
+            AsyncWebCrawler, CrawlerRunConfig, trafilatura = await asyncio.to_thread(load_crawler)
         async with AsyncWebCrawler() as crawler:
-            result = await crawler.arun(
-                url=website,
-            )
+            with tracer.span('arun', url=website, profile=CRAWL_PROFILE) as span:
+                light = CRAWL_PROFILE == 'light'
+                stats = {'requests': 0, 'blocked_requests': 0, 'transferred_bytes': 0}
+                crawler.crawler_strategy.set_hook('on_page_context_created', profile_hook(stats, block=light))
+                if light:
+                    # Navigation returns at the first response bytes, the page is ready by LIGHT_READY_CONDITION
+                    config = CrawlerRunConfig(wait_until='commit', wait_for=LIGHT_READY_CONDITION,
+                                              page_timeout=LIGHT_PAGE_TIMEOUT)
+                    result = await crawler.arun(url=website, config=config)
+                else:
+                    result = await crawler.arun(
+                        url=website,
+                    )
+                span.set(response_bytes=len(result.html or ''), **stats)
             html = str(result.html)
-            html = trafilatura.extract(html,
-                                       deduplicate=True,
-                                       favor_precision=True,
-                                       include_comments=False,
-                                       output_format='markdown',
-                                       with_metadata=True,
-                                       )
+            with tracer.span('trafilatura', request_bytes=len(html)):
+                # CPU bound, in a thread so the server (possibly running in the client's event loop) keeps serving.
+                html = await asyncio.to_thread(trafilatura.extract, html,
+                                               deduplicate=True,
+                                               favor_precision=True,
+                                               include_comments=False,
+                                               output_format='markdown',
+                                               with_metadata=True,
+                                               )
             if not html:
-                html = 'Cannot crawl this web page, please try another web page instead'
+                raise RuntimeError(f'No content extracted from {website}')
             if len(html) > 2048:
                 html = html[:2048]
             output = {"text": html}
@@ -59,10 +186,11 @@ async def crawl_website(website: str) -> str:
                             })
                 output["media"] = media_list
             return json.dumps(output, ensure_ascii=False)
-    except Exception:
+    except Exception as e:
         import traceback
         print(traceback.format_exc())
-        return 'Cannot crawl this web page, please try another web page instead'
+        # Raised, so the client gets an `isError` result and does not cache the failure
+        raise RuntimeError('Cannot crawl this web page, please try another web page instead') from e
 
 
 if __name__ == "__main__":
@@ -1,11 +1,18 @@
 import json
+import os
+import sys
 from dataclasses import dataclass, field
 from typing import List, Dict, Union, Any
 
 from fastmcp import FastMCP
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from mcp_central.tracing import Tracer  # noqa: E402
+
 mcp = FastMCP("notebook")
 
+tracer = Tracer("notebook")
+
 
 @dataclass
 class Task:
@@ -153,6 +160,7 @@ notebook = None
                       '\'conditions_and_todo_list\' parameter should contain a structured breakdown of completion '
                       'conditions and high-level steps needed. This tool initializes the planning system and clears '
                       'any existing plans.')
+@tracer.traced()
 def initialize_task(user_query: str, conditions_and_todo_list) -> str:
     global notebook
     notebook = Notebook()
@@ -172,6 +180,7 @@ def initialize_task(user_query: str, conditions_and_todo_list) -> str:
                       'After creating a plan, use `advance_to_next_step` to start executing steps sequentially. '
                       'Example format: [{"step": "Main step 1", "substeps": ["Sub-step 1.1", "Sub-step 1.2"]}, '
                       '"Simple step without substeps", {"step": "Main step 3", "substeps": ["Sub-step 3.1"]}]')
+@tracer.traced()
 def create_execution_plan(plans: List[Union[str, Dict[str, Any]]]) -> str:
     try:
         global notebook
@@ -194,6 +203,7 @@ def create_execution_plan(plans: List[Union[str, Dict[str, Any]]]) -> str:
                       'from previous main steps will be lost, so ensure your summary contains everything needed '
                       'to successfully complete the user\'s request. '
                       'Main steps are automatically marked complete when all their sub-steps are completed.')
+@tracer.traced()
 def advance_to_next_step(summary_and_result: str = "") -> str:
     global notebook
     if summary_and_result:
@@ -249,6 +259,7 @@ def advance_to_next_step(summary_and_result: str = "") -> str:
                 'you\'ve finished all planned tasks. It will display the original query, success criteria, and '
                 'any remaining plans for verification. Use this final check to ensure all requirements have been '
                 'met before delivering your response to the user.')
+@tracer.traced()
 def verify_task_completion() -> str:
     global notebook
 
@@ -1,10 +1,19 @@
+import asyncio
 import json
+import os
 import subprocess
+import sys
 from fastmcp import FastMCP
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from mcp_central.tracing import Tracer  # noqa: E402
+
 mcp = FastMCP("ocrmypdf_server")
 
+tracer = Tracer("ocrmypdf")
+
 @mcp.tool(description='A tool to perform OCR on a PDF file and return the extracted text.')
+@tracer.traced()
 async def ocr_pdf(input_pdf: str, output_pdf: str) -> str:
     try:
         command = [
@@ -16,7 +25,9 @@ async def ocr_pdf(input_pdf: str, output_pdf: str) -> str:
         ]
 
 
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
+        with tracer.span('ocrmypdf', input_bytes=os.path.getsize(input_pdf) if os.path.exists(input_pdf) else 0):
+            # In a thread, so the server (possibly running in the client's event loop) keeps serving.
+            result = await asyncio.to_thread(subprocess.run, command, check=True, capture_output=True, text=True)
 
 
         print("OCR completed:")
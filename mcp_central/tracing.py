@@ -0,0 +1,222 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque, namedtuple
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from mcp import ClientSession, types
+from mcp.server.lowlevel.server import request_ctx
+
+# Set this env to export spans, the MCP clients pass it to the servers they spawn.
+TRACE_FILE_ENV = 'MCP_TRACE_FILE'
+
+# The max number of finished spans kept in memory for `summary`
+MAX_SPANS = 10000
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+# Shared by the tracers of a process, so the summary of a query includes the spans of the in-process servers
+_spans = deque(maxlen=MAX_SPANS)
+_spans_lock = threading.Lock()
+
+# The trace and span id of a span in another process
+SpanContext = namedtuple('SpanContext', ['trace_id', 'span_id'])
+
+
+class Span:
+
+    def __init__(self, name: str, service: str, parent: Optional['Span'] = None, **attributes):
+        self.name = name
+        self.service = service
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.end = None
+        self.status = 'ok'
+        self.attributes: Dict[str, Any] = dict(attributes)
+
+    @property
+    def duration(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Field names follow the OTLP json span encoding.
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'startTimeUnixNano': int(self.start * 1e9),
+            'endTimeUnixNano': int((self.end or time.time()) * 1e9),
+            'attributes': {'service.name': self.service, **self.attributes},
+            'status': self.status,
+        }
+
+
+def traceparent(span: Span) -> str:
+    """The W3C `traceparent` of a span."""
+    return f'00-{span.trace_id}-{span.span_id}-01'
+
+
+def remote_parent() -> Optional[SpanContext]:
+    """The client span of the MCP request being handled, sent as `traceparent` in the request `_meta`."""
+    try:
+        meta = request_ctx.get().meta
+    except LookupError:
+        return None
+    value = getattr(meta, 'traceparent', None) if meta is not None else None
+    if not isinstance(value, str):
+        return None
+    parts = value.split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+
+async def call_tool(session, name: str, arguments: Optional[Dict[str, Any]] = None) -> types.CallToolResult:
+    """Call a tool with the active span sent as the `traceparent` of the request `_meta`.
+
+    The server opens its spans under it, see `remote_parent`. Sessions wrapping a `ClientSession` are called as is.
+    """
+    span = Tracer.current()
+    if span is None or not isinstance(session, ClientSession):
+        return await session.call_tool(name, arguments)
+    params = types.CallToolRequestParams(name=name, arguments=arguments, _meta={'traceparent': traceparent(span)})
+    return await session.send_request(
+        types.ClientRequest(types.CallToolRequest(method='tools/call', params=params)),
+        types.CallToolResult,
+    )
+
+
+class Tracer:
+    """Records spans in memory and appends the finished ones to a JSONL file if `MCP_TRACE_FILE` is set.
+
+    Args:
+        service: The service name recorded in every span.
+        path: The JSONL file to export the spans to, defaults to the `MCP_TRACE_FILE` env.
+    """
+
+    def __init__(self, service: str, path: Optional[str] = None):
+        self.service = service
+        self.path = path or os.environ.get(TRACE_FILE_ENV)
+        self.spans = _spans
+        self._lock = _spans_lock
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name: str, default_parent: Optional[Span] = None, **attributes):
+        """Open a span as a child of the active span, or of `default_parent` if no span is active.
+
+        In a server, the first span of a request is a child of the client span sent with the request.
+        """
+        parent = self.current()
+        if parent is None or parent.service != self.service:
+            # An in-process server inherits the context of the client task which connected to it
+            parent = remote_parent() or parent
+        span = Span(name, self.service, parent or default_parent, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = 'error'
+            span.set(error=f'{type(e).__name__}: {e}')
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Exited in another context, e.g. an async generator resumed in another task.
+                pass
+            self.finish(span)
+
+    def finish(self, span: Span):
+        span.end = time.time()
+        with self._lock:
+            self.spans.append(span)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n')
+
+    def traced(self, name: Optional[str] = None):
+        """Decorate a sync or async function to run it in a span with its payload sizes."""
+
+        def decorator(func):
+            span_name = name or func.__name__
+
+            def _start(args, kwargs):
+                return self.span(span_name, request_bytes=payload_size([args, kwargs]))
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with _start(args, kwargs) as span:
+                        result = await func(*args, **kwargs)
+                        span.set(response_bytes=payload_size(result))
+                        return result
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with _start(args, kwargs) as span:
+                        result = func(*args, **kwargs)
+                        span.set(response_bytes=payload_size(result))
+                        return result
+            return wrapper
+
+        return decorator
+
+    def summary(self, trace_id: str) -> str:
+        """A table of the spans of one trace grouped by name."""
+        rows = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            spans: List[Dict[str, Any]] = [span.to_dict() for span in self.spans if span.trace_id == trace_id]
+        # The spans of the servers running in other processes are only in the exported file
+        seen = {span['spanId'] for span in spans}
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    if trace_id not in line:
+                        continue
+                    span = json.loads(line)
+                    if span['traceId'] == trace_id and span['spanId'] not in seen:
+                        seen.add(span['spanId'])
+                        spans.append(span)
+        for span in spans:
+            duration = (span['endTimeUnixNano'] - span['startTimeUnixNano']) / 1e6
+            row = rows[span['name']]
+            row['calls'] += 1
+            row['errors'] += span['status'] == 'error'
+            row['total_ms'] += duration
+            row['max_ms'] = max(row['max_ms'], duration)
+            for key in ('request_bytes', 'response_bytes', 'prompt_tokens', 'completion_tokens'):
+                row[key] += span['attributes'].get(key) or 0
+        header = (f'{"span":<28}{"calls":>7}{"errors":>8}{"total(ms)":>12}{"max(ms)":>10}'
+                  f'{"req(B)":>10}{"resp(B)":>10}{"prompt":>9}{"compl":>8}')
+        lines = [header]
+        for name, row in sorted(rows.items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f'{name:<28}{int(row["calls"]):>7}{int(row["errors"]):>8}{row["total_ms"]:>12.0f}'
+                         f'{row["max_ms"]:>10.0f}{int(row["request_bytes"]):>10}{int(row["response_bytes"]):>10}'
+                         f'{int(row["prompt_tokens"]):>9}{int(row["completion_tokens"]):>8}')
+        return '\n'.join(lines)
+
+
+def payload_size(payload: Any) -> int:
+    if payload is None:
+        return 0
+    if isinstance(payload, bytes):
+        return len(payload)
+    if not isinstance(payload, str):
+        payload = json.dumps(payload, ensure_ascii=False, default=str)
+    return len(payload.encode('utf-8'))